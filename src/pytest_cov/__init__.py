@@ -33,6 +33,12 @@ class CentralCovContextWarning(PytestCovWarning):
     """
 
 
+class CovImportCacheWarning(PytestCovWarning):
+    """
+    Indicates that the import cache didn't cover all the modules imported during collection.
+    """
+
+
 class DistCovError(Exception):
     """
     Raised when dynamic_context is set to test_function and xdist is also used.
@@ -0,0 +1,238 @@
+"""A memory-mappable binary coverage snapshot, and the reader for it.
+
+All integers are little-endian. The file starts with a fixed size header::
+
+    magic "PYCOVBIN", version, flags, file count, context count,
+    statements, missing, excluded, branches, partial branches, missing branches, percent covered,
+    offsets of the file index and of the context table
+
+The file index has one fixed size record per reported file, sorted by path, with the per-file totals and the offsets of:
+
+* the path, in the string table;
+* the line status array: one byte per line number (0 to the last line), see the ``LINE_*`` constants;
+* the context list (only when the data has contexts): a count, then (context id, bitmap offset) pairs. Each bitmap has
+  one bit per line number, set if the line was executed in that context.
+
+The context table has one (offset, length) string table reference per context name.
+"""
+
+import mmap
+import struct
+from pathlib import Path
+
+from coverage.report_core import get_analysis_to_report
+from coverage.results import Numbers
+
+MAGIC = b'PYCOVBIN'
+VERSION = 1
+
+FLAG_BRANCH = 1
+FLAG_CONTEXTS = 2
+
+LINE_NONE = 0
+LINE_EXECUTED = 1
+LINE_MISSING = 2
+LINE_EXCLUDED = 3
+LINE_PARTIAL = 4
+LINE_STATUS = {
+    LINE_NONE: None,
+    LINE_EXECUTED: 'executed',
+    LINE_MISSING: 'missing',
+    LINE_EXCLUDED: 'excluded',
+    LINE_PARTIAL: 'partial',
+}
+
+HEADER = struct.Struct('<8sIIII6QdQQ')
+FILE_RECORD = struct.Struct('<QI6IIQQ')
+STRING = struct.Struct('<QI')
+COUNT = struct.Struct('<I')
+CONTEXT_ENTRY = struct.Struct('<IQ')
+
+TOTALS = ('statements', 'missing', 'excluded', 'branches', 'partial_branches', 'missing_branches')
+
+
+def _counts(numbers):
+    return (
+        numbers.n_statements,
+        numbers.n_missing,
+        numbers.n_excluded,
+        numbers.n_branches,
+        numbers.n_partial_branches,
+        numbers.n_missing_branches,
+    )
+
+
+def _write_string(outfile, value):
+    encoded = value.encode('utf-8')
+    offset = outfile.tell()
+    outfile.write(encoded)
+    return offset, len(encoded)
+
+
+def write_binary_report(cov, output):
+    """Write the snapshot of the data loaded in `cov`, one source file at a time. Returns the total percentage."""
+    cov.config.ignore_errors = True
+    cov._prepare_data_for_reporting()
+    data = cov.get_data()
+    data.set_query_contexts(cov.config.report_contexts)
+    has_arcs = data.has_arcs()
+    with_contexts = bool(data.measured_contexts() - {''})
+    total = Numbers(precision=cov.config.precision)
+    context_ids = {}
+    records = []
+
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        with output.open('wb') as outfile:
+            outfile.write(bytes(HEADER.size))
+            for fr, analysis in get_analysis_to_report(cov, None):
+                total += analysis.numbers
+                last_line = max(analysis.statements | analysis.excluded, default=0)
+                status = bytearray(last_line + 1)
+                for line in analysis.excluded:
+                    status[line] = LINE_EXCLUDED
+                for line in analysis.statements:
+                    status[line] = LINE_MISSING if line in analysis.missing else LINE_EXECUTED
+                if has_arcs:
+                    for line in analysis.missing_branch_arcs():
+                        if status[line] == LINE_EXECUTED:
+                            status[line] = LINE_PARTIAL
+                status_offset = outfile.tell()
+                outfile.write(status)
+
+                contexts_offset = 0
+                if with_contexts:
+                    bitmaps = {}
+                    for line, contexts in data.contexts_by_lineno(analysis.filename).items():
+                        if line > last_line:
+                            continue
+                        for context in contexts:
+                            context_id = context_ids.setdefault(context, len(context_ids))
+                            bitmap = bitmaps.setdefault(context_id, bytearray(last_line // 8 + 1))
+                            bitmap[line // 8] |= 1 << (line % 8)
+                    entries = []
+                    for context_id, bitmap in sorted(bitmaps.items()):
+                        entries.append(CONTEXT_ENTRY.pack(context_id, outfile.tell()))
+                        outfile.write(bitmap)
+                    contexts_offset = outfile.tell()
+                    outfile.write(COUNT.pack(len(entries)))
+                    outfile.write(b''.join(entries))
+
+                path_ref = _write_string(outfile, fr.relative_filename())
+                # Sorted by the key BinaryReport._find searches with: the path with forward slashes.
+                sort_key = fr.relative_filename().replace('\\', '/').encode('utf-8')
+                records.append((sort_key, path_ref, analysis.numbers, last_line, status_offset, contexts_offset))
+
+            context_refs = [_write_string(outfile, context) for context in context_ids]
+
+            files_offset = outfile.tell()
+            for _, path_ref, numbers, last_line, status_offset, contexts_offset in sorted(records, key=lambda record: record[0]):
+                outfile.write(FILE_RECORD.pack(*path_ref, *_counts(numbers), last_line, status_offset, contexts_offset))
+            contexts_table_offset = outfile.tell()
+            for context_ref in context_refs:
+                outfile.write(STRING.pack(*context_ref))
+
+            flags = (FLAG_BRANCH if has_arcs else 0) | (FLAG_CONTEXTS if with_contexts else 0)
+            pc_covered = total.pc_covered if total.n_statements else 0.0
+            outfile.seek(0)
+            outfile.write(
+                HEADER.pack(
+                    MAGIC, VERSION, flags, len(records), len(context_ids), *_counts(total), pc_covered, files_offset, contexts_table_offset
+                )
+            )
+    except BaseException:
+        output.unlink(missing_ok=True)
+        raise
+
+    return total.n_statements and total.pc_covered
+
+
+class BinaryReport:
+    """Read-only access to a binary coverage snapshot, without parsing it.
+
+    The file is memory-mapped, looking up a file is a binary search over the sorted file index and everything after
+    that (totals, line status, contexts of a line) is read straight from the mapping.
+    """
+
+    def __init__(self, path):
+        with Path(path).open('rb') as fh:
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        header = HEADER.unpack_from(self._mmap)
+        magic, version, flags, self._n_files, self._n_contexts = header[:5]
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f'{path} is not a pytest-cov binary coverage snapshot.')
+        if version != VERSION:
+            self.close()
+            raise ValueError(f'{path} has version {version} of the binary coverage snapshot format, expected {VERSION}.')
+        self.version = version
+        self.has_branches = bool(flags & FLAG_BRANCH)
+        self.has_contexts = bool(flags & FLAG_CONTEXTS)
+        self._totals = header[5:11]
+        self.percent_covered = header[11]
+        self._files_offset, self._contexts_offset = header[12:]
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._n_files
+
+    def _string(self, offset, length):
+        return self._mmap[offset : offset + length].decode('utf-8')
+
+    def _record(self, index):
+        return FILE_RECORD.unpack_from(self._mmap, self._files_offset + index * FILE_RECORD.size)
+
+    def _find(self, path):
+        encoded = str(path).replace('\\', '/').encode('utf-8')
+        low, high = 0, self._n_files
+        while low < high:
+            middle = (low + high) // 2
+            record = self._record(middle)
+            found = self._mmap[record[0] : record[0] + record[1]].replace(b'\\', b'/')
+            if found == encoded:
+                return record
+            if found < encoded:
+                low = middle + 1
+            else:
+                high = middle
+        raise KeyError(path)
+
+    def totals(self, path=None):
+        """Return the statement and branch counts for the whole snapshot or for one file."""
+        counts = self._totals if path is None else self._find(path)[2:8]
+        return dict(zip(TOTALS, counts))
+
+    def files(self):
+        """Return the paths of the reported files, sorted."""
+        return [self._string(*self._record(index)[:2]) for index in range(self._n_files)]
+
+    def line_status(self, path, line):
+        """Return "executed", "missing", "partial" (with missing branches), "excluded" or None for a line."""
+        record = self._find(path)
+        last_line, status_offset = record[8:10]
+        if not 0 < line <= last_line:
+            return None
+        return LINE_STATUS[self._mmap[status_offset + line]]
+
+    def line_contexts(self, path, line):
+        """Return the names of the contexts that executed a line."""
+        record = self._find(path)
+        last_line, contexts_offset = record[8], record[10]
+        if not self.has_contexts or not 0 < line <= last_line:
+            return []
+        (count,) = COUNT.unpack_from(self._mmap, contexts_offset)
+        contexts = []
+        for index in range(count):
+            context_id, bitmap_offset = CONTEXT_ENTRY.unpack_from(self._mmap, contexts_offset + COUNT.size + index * CONTEXT_ENTRY.size)
+            if self._mmap[bitmap_offset + line // 8] & (1 << (line % 8)):
+                contexts.append(self._string(*STRING.unpack_from(self._mmap, self._contexts_offset + context_id * STRING.size)))
+        return contexts
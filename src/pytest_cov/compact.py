@@ -0,0 +1,87 @@
+"""Keep the data files accumulated with --cov-append small and quick to report on.
+
+Coverage merges the data of a run into the data file with indexed queries, so appending costs about as much as the new data.
+Reading the data back does not: the lines or arcs of a file are stored once for every context they were measured in (every
+test with ``--cov-context=test``), and every report goes through all of them. Folding the contexts into the empty one leaves
+a single set of lines or arcs per file.
+
+Usage::
+
+    pytest-cov-compact [--keep-contexts] [DATA_FILE]
+
+Without ``--keep-contexts`` the contexts of the data file are folded. With it, the file is only rewritten without the space
+left by the data that was removed from it (with ``--cov-rerun`` for example).
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+from coverage.data import CoverageData
+from coverage.exceptions import CoverageException
+
+DEFAULT_DATA_FILE = '.coverage'
+
+
+def fold(data_file):
+    """Rewrite `data_file` with the data of all its contexts merged into the empty context.
+
+    Returns False if there was nothing to fold.
+    """
+    data = CoverageData(os.fspath(data_file))
+    data.read()
+    if not data.measured_contexts() - {''}:
+        return False
+
+    path = Path(data_file)
+    # Not named like the parallel data files (".coverage.*"), which a concurrent combine would pick up.
+    target = path.with_name(f'{path.name}-compact.{os.getpid()}.tmp')
+    folded = CoverageData(os.fspath(target))
+    folded.erase()
+    measured = data.measured_files()
+    for filename in sorted(measured):
+        if data.has_arcs():
+            folded.add_arcs({filename: data.arcs(filename) or []})
+        else:
+            folded.add_lines({filename: data.lines(filename) or []})
+    folded.touch_files(measured)
+    folded.add_file_tracers({filename: tracer for filename in measured if (tracer := data.file_tracer(filename))})
+    folded.close()
+    data.close()
+    target.replace(path)
+    return True
+
+
+def vacuum(data_file):
+    """Rewrite `data_file` without the free space and with the rows of each table stored together."""
+    data = CoverageData(os.fspath(data_file))
+    data.read()
+    with data._connect() as con:
+        con.execute_void('VACUUM')
+    data.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='pytest-cov-compact', description='Compact a coverage data file accumulated with --cov-append.')
+    parser.add_argument('data_file', nargs='?', default=DEFAULT_DATA_FILE, help=f'The data file to compact. Default: {DEFAULT_DATA_FILE}')
+    parser.add_argument('--keep-contexts', action='store_true', help='Keep the contexts, only reclaim the free space of the file.')
+    args = parser.parse_args(argv)
+
+    path = Path(args.data_file)
+    if not path.is_file():
+        print(f'pytest-cov-compact: no data file at {path}', file=sys.stderr)
+        return 1
+    size = path.stat().st_size
+    try:
+        if args.keep_contexts or not fold(path):
+            vacuum(path)
+    except CoverageException as exc:
+        print(f'pytest-cov-compact: {exc}', file=sys.stderr)
+        return 1
+    print(f'{path}: {size} -> {path.stat().st_size} bytes')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Coverage changes against a previous run."""
+
+from pathlib import Path
+
+from coverage.data import CoverageData
+from coverage.results import analysis_from_file_reporter
+from coverage.results import display_covered
+
+SUMMARY_CACHE_KEY = 'cov/summary'
+
+
+def _counts(numbers):
+    return [numbers.n_statements, numbers.n_missing, numbers.n_branches, numbers.n_missing_branches]
+
+
+def _percent(counts):
+    statements, missing, branches, missing_branches = counts
+    possible = statements + branches
+    return 100.0 * (possible - missing - missing_branches) / possible if possible else 100.0
+
+
+def summaries(cov, analyses, previous_data_file=None):
+    """Return the per-file counts of the current run, and of a previous data file if given.
+
+    `analyses` are the (file reporter, analysis) pairs the other reports of the run use. The previous data is analysed with
+    the same file reporters, so the sources are parsed only once.
+    """
+    previous_data = None
+    if previous_data_file is not None:
+        previous_data = CoverageData(previous_data_file)
+        previous_data.read()
+
+    current = {}
+    previous = {}
+    for fr, analysis in analyses:
+        name = fr.relative_filename()
+        current[name] = _counts(analysis.numbers)
+        if previous_data is not None and previous_data.has_arcs() == analysis.has_arcs:
+            filename = cov._file_mapper(fr.filename)
+            if filename in previous_data.measured_files():
+                previous[name] = _counts(analysis_from_file_reporter(previous_data, cov.config.precision, fr, filename).numbers)
+    return current, previous
+
+
+def compare_report(cov, analyses, against, cache, stream, precision):
+    """Write the coverage changes against a previous data file, or the summary stored in the cache by the previous run.
+
+    The summary of this run is stored in the cache for the next comparison.
+    """
+    if precision is None:
+        precision = cov.config.precision
+
+    if against == 'cache':
+        current, _ = summaries(cov, analyses)
+        previous = cache.get(SUMMARY_CACHE_KEY, None) if cache is not None else None
+        missing = 'No previous coverage summary in the cache.'
+    elif Path(against).exists():
+        current, previous = summaries(cov, analyses, against)
+    else:
+        current, _ = summaries(cov, analyses)
+        previous = None
+        missing = f'No previous coverage data in {against}.'
+    if cache is not None:
+        cache.set(SUMMARY_CACHE_KEY, current)
+
+    if previous is None:
+        stream.write(f'{missing}\n')
+        return
+
+    rows = []
+    for name in sorted(current.keys() | previous.keys()):
+        before = _percent(previous[name]) if name in previous else None
+        after = _percent(current[name]) if name in current else None
+        if before is None or after is None or display_covered(before, precision) != display_covered(after, precision):
+            rows.append((name, before, after))
+    before_total = _percent([sum(column) for column in zip(*previous.values())]) if previous else None
+    after_total = _percent([sum(column) for column in zip(*current.values())])
+
+    def cover(pc):
+        return '-' if pc is None else display_covered(pc, precision) + '%'
+
+    def change(before, after):
+        if before is None or after is None:
+            return 'new' if before is None else 'removed'
+        return f'{after - before:+.{precision}f}%'
+
+    width = max(len('TOTAL'), *(len(name) for name, _, _ in rows))
+    header = f'{"Name":<{width}}   Before    After   Change'
+    rule = '-' * len(header)
+    stream.write(f'{header}\n{rule}\n')
+    for name, before, after in rows:
+        stream.write(f'{name:<{width}}  {cover(before):>7}  {cover(after):>7}  {change(before, after):>7}\n')
+    if rows:
+        stream.write(f'{rule}\n')
+    stream.write(f'{"TOTAL":<{width}}  {cover(before_total):>7}  {cover(after_total):>7}  {change(before_total, after_total):>7}\n')
@@ -0,0 +1,214 @@
+"""A long-lived process that keeps the coverage of a project warm, for watch mode and repeated local runs.
+
+Usage::
+
+    pytest-cov-daemon &
+    pytest --cov=mypackage --cov-daemon tests/test_feature.py
+
+Every run normally builds a Coverage instance, reads the configuration and parses all the measured sources again to
+report. The daemon serves the project directory it is started in over a Unix socket (``.coverage-daemon.sock`` by
+default). It keeps a Coverage instance for each configuration it is asked about, with the sources it parsed (until they
+change) and the data of all the runs so far: each run sends the path of its combined data file, the daemon merges it in
+and sends back the terminal report and the total.
+
+When a source file changes, the data the previous runs recorded for it is dropped. ``pytest-cov-daemon --reset`` drops all
+the data, and ``pytest-cov-daemon --stop`` stops the daemon.
+"""
+
+import argparse
+import copy
+import json
+import os
+import socket
+import socketserver
+import sys
+from io import StringIO
+from pathlib import Path
+
+import coverage
+from coverage.data import CoverageData
+from coverage.exceptions import CoverageException
+
+PROTOCOL_VERSION = 1
+DEFAULT_SOCKET = '.coverage-daemon.sock'
+TIMEOUT = 60
+CONFIG_FILES = ('.coveragerc', 'setup.cfg', 'tox.ini', 'pyproject.toml')
+
+
+def _stamp(filename):
+    try:
+        stat = Path(filename).stat()
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class Session:
+    """The warm coverage of one configuration: a Coverage instance, the merged data and the file reporters of the sources."""
+
+    def __init__(self, config_file, source, branch):
+        self.cov = coverage.Coverage(source=source, branch=branch, data_file=None, config_file=config_file)
+        self.cov._warn_no_data = False
+        # The runs send data that was already combined, with the paths remapped.
+        self.cov.config.paths = {}
+        self.stamps = {}
+        self.file_reporters = {}
+        self._get_file_reporter = self.cov._get_file_reporter
+        self.cov._get_file_reporter = self.get_file_reporter
+
+    def get_file_reporter(self, morf):
+        """Return the file reporter of a source, parsed again only if the source changed."""
+        if not isinstance(morf, str):
+            return self._get_file_reporter(morf)
+        stamp = _stamp(morf)
+        cached = self.file_reporters.get(morf)
+        if cached is None or cached[0] is None or cached[0] != stamp:
+            cached = self.file_reporters[morf] = (stamp, self._get_file_reporter(morf))
+        return cached[1]
+
+    def merge(self, data_file):
+        """Merge the data of a run, dropping what previous runs recorded for the sources changed since."""
+        run = CoverageData(data_file)
+        run.read()
+        previous = self.cov.get_data()
+        changed = {filename for filename, stamp in self.stamps.items() if _stamp(filename) != stamp}
+        keep = previous.measured_files() - changed if previous.has_arcs() == run.has_arcs() else set()
+
+        # The run is the only database attached to the new one: older versions of coverage can't attach a second one.
+        data = CoverageData(no_disk=True)
+        data.update(run)
+        if keep and previous.has_arcs():
+            data.add_arcs({filename: previous.arcs(filename) or [] for filename in keep})
+        elif keep:
+            data.add_lines({filename: previous.lines(filename) or [] for filename in keep})
+        if keep:
+            data.touch_files(keep)
+        self.cov._data = data
+        self.stamps = {filename: self.stamps[filename] for filename in keep if filename in self.stamps}
+        self.stamps.update((filename, _stamp(filename)) for filename in run.measured_files())
+
+    def report(self, options):
+        """Return the terminal report and the total."""
+        output = StringIO()
+        config = self.cov.config
+        self.cov.config = copy.copy(config)
+        try:
+            total = self.cov.report(file=output, ignore_errors=True, **options)
+        finally:
+            self.cov.config = config
+        return output.getvalue(), total
+
+
+class Daemon:
+    def __init__(self, topdir):
+        self.topdir = topdir
+        self.sessions = {}
+        self.stopping = False
+
+    def session(self, request):
+        # The configuration is read again when one of the files it may come from changes.
+        config_stamps = [(name, _stamp(Path(self.topdir, name))) for name in sorted({request['config_file'], *CONFIG_FILES})]
+        key = json.dumps([request['config_file'], request['source'], request['branch'], config_stamps])
+        if key not in self.sessions:
+            self.sessions[key] = Session(request['config_file'], request['source'], request['branch'])
+        return self.sessions[key]
+
+    def handle(self, request):
+        if request.get('version') != PROTOCOL_VERSION:
+            return {'error': f'unsupported protocol version {request.get("version")!r}, the daemon uses {PROTOCOL_VERSION}'}
+        command = request.get('command')
+        if command == 'ping':
+            return {}
+        if command == 'stop':
+            self.stopping = True
+            return {}
+        if command == 'reset':
+            self.sessions.clear()
+            return {}
+        if command != 'report':
+            return {'error': f'unknown command {command!r}'}
+        if os.path.realpath(request['topdir']) != os.path.realpath(self.topdir):
+            return {'error': f'the daemon serves {self.topdir}, not {request["topdir"]}'}
+        session = self.session(request)
+        session.merge(request['data_file'])
+        report, total = session.report(request['options'])
+        return {'report': report, 'total': total}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            response = self.server.daemon.handle(json.loads(self.rfile.readline()))
+        except Exception as exc:
+            response = {'error': f'{type(exc).__name__}: {exc}'}
+        self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+def request(socket_path, payload, timeout=TIMEOUT):
+    """Send a request to the daemon listening on `socket_path` and return its response.
+
+    Raises OSError if the daemon can't be reached, and CoverageException if it failed to handle the request.
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        raise OSError('Unix sockets are not supported on this platform')
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(os.fspath(socket_path))
+        sock.sendall(json.dumps({'version': PROTOCOL_VERSION, **payload}).encode() + b'\n')
+        with sock.makefile('rb') as reader:
+            line = reader.readline()
+    if not line:
+        raise OSError('The coverage daemon closed the connection')
+    response = json.loads(line)
+    if 'error' in response:
+        raise CoverageException(f'The coverage daemon failed: {response["error"]}')
+    return response
+
+
+def serve(socket_path):
+    """Handle the requests one at a time until asked to stop. The Coverage instances can't be shared by threads."""
+    path = Path(socket_path)
+    if path.exists():
+        try:
+            request(path, {'command': 'ping'}, timeout=1)
+        except OSError:
+            # Left by a daemon that didn't stop cleanly.
+            path.unlink()
+        else:
+            raise CoverageException(f'A coverage daemon is already listening on {socket_path}')
+    server = socketserver.UnixStreamServer(os.fspath(path), _Handler)
+    server.daemon = Daemon(os.fspath(Path.cwd()))
+    try:
+        while not server.daemon.stopping:
+            server.handle_request()
+    finally:
+        server.server_close()
+        path.unlink(missing_ok=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='pytest-cov-daemon',
+        description='Keep the coverage of the project in the current directory warm for the runs with --cov-daemon.',
+    )
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help=f'The Unix socket to listen on. Default: {DEFAULT_SOCKET}')
+    action = parser.add_mutually_exclusive_group()
+    action.add_argument('--reset', action='store_true', help='Drop the data of the previous runs from the running daemon.')
+    action.add_argument('--stop', action='store_true', help='Stop the running daemon.')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.reset or args.stop:
+            request(args.socket, {'command': 'reset' if args.reset else 'stop'})
+        else:
+            serve(args.socket)
+    except (OSError, CoverageException) as exc:
+        print(f'pytest-cov-daemon: {exc}', file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""Coverage of the lines changed since a git base ref."""
+
+import re
+import subprocess
+from pathlib import Path
+
+from coverage.exceptions import CoverageException
+from coverage.results import display_covered
+from coverage.results import format_lines
+
+DEFAULT_BASE = 'origin/main'
+
+HUNK_RE = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@')
+ESCAPE_RE = re.compile(r'\\(?:([0-7]{3})|(.))')
+ESCAPES = {'a': '\a', 'b': '\b', 't': '\t', 'n': '\n', 'v': '\v', 'f': '\f', 'r': '\r', '"': '"', '\\': '\\'}
+
+
+def run_git(*args, cwd):
+    try:
+        result = subprocess.run(['git', '-c', 'core.quotePath=false', *args], cwd=cwd, capture_output=True, text=True, check=False)  # noqa: S603, S607
+    except OSError as exc:
+        raise CoverageException(f'Cannot run git: {exc}') from None
+    if result.returncode:
+        raise CoverageException(f'git {args[0]} failed: {result.stderr.strip()}')
+    return result.stdout
+
+
+def header_path(header):
+    """Return the path of a ``+++`` line of a diff.
+
+    git ends the line with a tab when the path has a space, and quotes the paths with unusual characters with C-style
+    escapes (octal for the bytes of the characters it doesn't print).
+    """
+    path = header.removesuffix('\t')
+    if not (path.startswith('"') and path.endswith('"')):
+        return path
+    unquoted = bytearray()
+    position = 1
+    for match in ESCAPE_RE.finditer(path, 1, len(path) - 1):
+        unquoted += path[position : match.start()].encode()
+        unquoted += bytes([int(match[1], 8)]) if match[1] else ESCAPES.get(match[2], match[2]).encode()
+        position = match.end()
+    unquoted += path[position:-1].encode()
+    return unquoted.decode(errors='surrogateescape')
+
+
+def changed_lines(base, cwd):
+    """Return the merge base of `base` and HEAD and the lines added or modified since then, by absolute path.
+
+    Uncommitted changes in the working tree are included, so the report matches what is being tested.
+    """
+    toplevel = Path(run_git('rev-parse', '--show-toplevel', cwd=cwd).strip()).resolve()
+    merge_base = run_git('merge-base', base, 'HEAD', cwd=cwd).strip()
+    diff = run_git('diff', '--no-color', '--no-ext-diff', '--unified=0', '--src-prefix=a/', '--dst-prefix=b/', merge_base, '--', cwd=cwd)
+
+    changed = {}
+    lines = None
+    for line in diff.splitlines():
+        if line.startswith('+++ '):
+            path = header_path(line[4:])
+            lines = None if path == '/dev/null' else changed.setdefault(str(toplevel / path[2:]), set())
+        elif lines is not None and (match := HUNK_RE.match(line)):
+            start = int(match[1])
+            count = 1 if match[2] is None else int(match[2])
+            lines.update(range(start, start + count))
+    return merge_base, changed
+
+
+def diff_report(cov, analyses, base, stream, precision):
+    """Write a table with the coverage of the changed statements. Returns the total percentage.
+
+    `analyses` are the (file reporter, analysis) pairs the other reports of the run use, so no source is parsed again. A
+    diff without changed statements is fully covered.
+    """
+    if precision is None:
+        precision = cov.config.precision
+    merge_base, changed = changed_lines(base, Path.cwd())
+
+    rows = []
+    for fr, analysis in analyses:
+        lines = changed.get(analysis.filename)
+        if not lines:
+            continue
+        statements = analysis.statements & lines
+        if statements:
+            rows.append((fr.relative_filename(), statements, analysis.missing & lines))
+
+    stream.write(f'Changed lines since {base} (merge base {merge_base[:12]})\n')
+    if not rows:
+        stream.write('No changed statements.\n')
+        return 100.0
+
+    def percent(statements, missing):
+        return 100.0 * (statements - missing) / statements
+
+    total_statements = sum(len(statements) for _, statements, _ in rows)
+    total_missing = sum(len(missing) for _, _, missing in rows)
+    width = max(len('TOTAL'), *(len(name) for name, _, _ in rows))
+    cover_width = max(len('Cover'), len(display_covered(100.0, precision)) + 1)
+    header = f'{"Name":<{width}}   Stmts   Miss  {"Cover":>{cover_width}}   Missing'
+    rule = '-' * len(header)
+    stream.write(f'{header}\n{rule}\n')
+    for name, statements, missing in sorted(rows):
+        cover = display_covered(percent(len(statements), len(missing)), precision) + '%'
+        stream.write(
+            f'{name:<{width}}  {len(statements):>6} {len(missing):>6}  {cover:>{cover_width}}   {format_lines(statements, missing)}\n'
+        )
+    total = percent(total_statements, total_missing)
+    cover = display_covered(total, precision) + '%'
+    stream.write(f'{rule}\n{"TOTAL":<{width}}  {total_statements:>6} {total_missing:>6}  {cover:>{cover_width}}\n')
+    return total
@@ -4,21 +4,85 @@ import argparse
 import contextlib
 import copy
 import functools
+import glob
+import hashlib
+import json
 import os
 import random
+import re
 import shutil
 import socket
 import sys
+import tempfile
+import threading
+import time
 import warnings
+from io import StringIO
 from pathlib import Path
 from typing import Union
 
 import coverage
+from coverage import inorout
 from coverage.data import CoverageData
+from coverage.data import combinable_files
+from coverage.data import combine_parallel_data
+from coverage.exceptions import CoverageException
+from coverage.report_core import get_analysis_to_report
+from coverage.results import display_covered
 from coverage.sqldata import filename_suffix
 
 from . import CentralCovContextWarning
+from . import CovImportCacheWarning
+from . import CovReportWarning
 from . import DistCovError
+from . import binary
+from . import compact
+from . import compare
+from . import daemon
+from . import diff
+from . import inventory
+from . import order
+from . import reports
+from .registry import custom_reporters
+
+REPORTS_CACHE_KEY = 'cov/reports'
+
+# The report types that write files, in the order they are produced, with
+# the coverage config attribute that holds their default destination.
+FILE_REPORTS = {
+    'annotate': None,
+    'html': 'html_dir',
+    'xml': 'xml_output',
+    'json': 'json_output',
+    'ndjson': None,
+    'markdown': None,
+    'markdown-append': None,
+    'lcov': 'lcov_output',
+    'binary': None,
+}
+REPORT_MESSAGES = {
+    'annotate': 'Coverage annotated source written to dir',
+    'html': 'Coverage HTML written to dir',
+    'xml': 'Coverage XML written to file',
+    'json': 'Coverage JSON written to file',
+    'ndjson': 'Coverage NDJSON written to file',
+    'markdown': 'Coverage Markdown information written to file',
+    'markdown-append': 'Coverage Markdown information appended to file',
+    'lcov': 'Coverage LCOV written to file',
+    'binary': 'Coverage binary snapshot written to file',
+}
+IMPORT_CACHE_VERSION = 1
+
+# Seconds between two combinations of the data files of subprocesses with --cov-coalesce.
+COALESCE_INTERVAL = 5
+# The process id in the suffix coverage gives to parallel data files ("host.1234.Xabcdefx", or "host.pid1234.Xabcdefx").
+DATA_FILE_PID_RE = re.compile(r'\.(?:pid)?(\d+)\.X\w+x$')
+
+# Seconds given to computing the total of an interrupted run before giving up.
+PARTIAL_TOTAL_TIMEOUT = 10
+
+# The slow reports that --cov-report-background moves to a worker thread.
+BACKGROUND_REPORTS = ('annotate', 'html', 'xml', 'json', 'ndjson', 'lcov', 'binary')
 
 
 class BrokenCovConfigError(Exception):
@@ -41,6 +105,52 @@ def _backup(obj, attr):
         setattr(obj, attr, backup)
 
 
+def _replace(source, destination):
+    """Move a freshly written file or directory over the destination without exposing partial output."""
+    source = Path(source)
+    if not source.is_dir():
+        source.replace(destination)
+        return
+    old = Path(f'{source}.old')
+    if Path(destination).exists():
+        Path(destination).replace(old)
+    source.replace(destination)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def _process_alive(pid):
+    if sys.platform == 'win32':
+        # os.kill would terminate it.
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def _finished_data_files(data_file):
+    """Return the parallel data files of `data_file` written by processes that exited.
+
+    A process that is still running may write its data file again, or still be writing it.
+    """
+    files = []
+    for path in combinable_files(data_file):
+        match = DATA_FILE_PID_RE.search(path)
+        if match and not _process_alive(int(match[1])):
+            files.append(path)
+    return files
+
+
+def _file_digest(filename):
+    try:
+        return hashlib.sha256(Path(filename).read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
 def _ensure_topdir(meth):
     @functools.wraps(meth)
     def ensure_topdir_wrapper(self, *args, **kwargs):
@@ -69,10 +179,43 @@ class CovController:
         self.cov_report = options.cov_report
         self.cov_config = options.cov_config
         self.cov_append = options.cov_append
+        self.cov_append_merged = options.cov_append_merged
+        self.cov_rerun = options.cov_rerun
+        self.cov_coalesce = options.cov_coalesce
+        self.cov_checkpoint = options.cov_checkpoint
+        self.checkpointed_at = None
+        self.cov_flush_every = options.cov_flush_every
+        self.tests_since_flush = 0
+        self.recovered_workers = []
+        self.children_data_file = None
+        self.children_coverage_file = None
+        self.children_process_config = None
+        self.coalesced_at = None
+        self.rerun_tests = set()
         self.cov_branch = options.cov_branch
         self.cov_precision = options.cov_precision
+        self.cov_reuse_reports = options.cov_reuse_reports
+        self.cov_report_background = options.cov_report_background
+        self.cov_stream_reports = options.cov_stream_reports
+        self.cov_compare = options.cov_compare
+        self.cov_import_cache = options.cov_import_cache
+        self.cov_affinity = options.cov_affinity
+        self.cov_split_platforms = options.cov_split_platforms
+        self.cov_measure_workers = options.cov_measure_workers
+        self.cov_daemon = options.cov_daemon
+        self.cov_source_inventory = options.cov_source_inventory
+        self.measuring_workers = {}
+        self.split_data = {}
+        self.split_paths = None
+        self.split_totals = {}
+        self.imported_before = None
+        self.import_snapshot = None
+        self.diff_total = None
+        self.analyses = None
         self.config = config
+        self.hook = config.hook
         self.nodeid = nodeid
+        self.cache = None
 
         self.cov = None
         self.combining_cov = None
@@ -82,6 +225,7 @@ class CovController:
         self.topdir = os.fspath(Path.cwd())
         self.is_collocated = None
         self.started = False
+        self.background_thread = None
 
     @contextlib.contextmanager
     def ensure_topdir(self):
@@ -102,9 +246,228 @@ class CovController:
 
     def start(self):
         self.started = True
+        self.hook.pytest_cov_started.call_historic(kwargs={'controller': self})
 
     def finish(self):
         self.started = False
+        if self.children_data_file is not None:
+            for name, value in (('COVERAGE_FILE', self.children_coverage_file), ('COVERAGE_PROCESS_CONFIG', self.children_process_config)):
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+            self.coalesce()
+
+    def checkpoint(self):
+        """Save the data collected so far, with --cov-checkpoint. Only the workers do it."""
+
+    def flush(self):
+        """Write the data collected so far to the data file and free it, every --cov-flush-every tests.
+
+        With --cov-context=test coverage already does it every time the context switches.
+        """
+        self.tests_since_flush += 1
+        if self.tests_since_flush < self.cov_flush_every:
+            return
+        self.tests_since_flush = 0
+        if self.started:
+            self.cov._collector.flush_data()
+
+    def redirect_children(self):
+        """Make the subprocesses started from now on write their data files with a prefix of their own.
+
+        The subprocesses read ``COVERAGE_FILE`` (with multiprocessing or ``COVERAGE_PROCESS_START``), or the configuration
+        passed in ``COVERAGE_PROCESS_CONFIG`` (with ``patch = subprocess``), so the files of the subprocesses can be told
+        apart from the ones of other processes and combined by :meth:`coalesce`.
+        """
+        self.children_coverage_file = os.environ.get('COVERAGE_FILE')
+        self.children_data_file = f'{os.path.abspath(self.cov.config.data_file)}.subprocesses-{os.getpid()}'  # noqa: PTH100
+        os.environ['COVERAGE_FILE'] = self.children_data_file
+        # With ``patch = subprocess`` the subprocesses get the whole configuration instead, and don't read COVERAGE_FILE.
+        self.children_process_config = os.environ.get('COVERAGE_PROCESS_CONFIG')
+        if self.children_process_config is not None:
+            config = copy.copy(self.cov.config)
+            config.data_file = self.children_data_file
+            os.environ['COVERAGE_PROCESS_CONFIG'] = config.serialize()
+        self.coalesced_at = time.monotonic()
+
+    def coalesce(self, force=True):
+        """Combine the data files written by the subprocesses so far into a single one, at most every few seconds unless forced.
+
+        Only the files of the subprocesses that exited are combined while the tests run, all of them when forced.
+        """
+        if self.children_data_file is None or (not force and time.monotonic() - self.coalesced_at < COALESCE_INTERVAL):
+            return
+        if force:
+            combine_parallel_data(CoverageData(self.children_data_file))
+        elif files := _finished_data_files(self.children_data_file):
+            combine_parallel_data(CoverageData(self.children_data_file), data_paths=files)
+        self.coalesced_at = time.monotonic()
+
+    def import_cache_path(self):
+        return Path(self.topdir, f'{self.cov.config.data_file}-imports.json')
+
+    def source_inventory_path(self):
+        return Path(self.topdir, f'{self.cov.config.data_file}-sources.json')
+
+    @contextlib.contextmanager
+    def source_inventory(self):
+        """Find the files that were never executed from the cached inventory while saving, with --cov-source-inventory."""
+        if not self.cov_source_inventory:
+            yield
+            return
+        cached = inventory.Inventory(self.source_inventory_path())
+        original = inorout.find_python_files
+        inorout.find_python_files = cached.find_python_files
+        try:
+            yield
+        finally:
+            inorout.find_python_files = original
+        cached.save()
+
+    def import_cache_key(self):
+        config = {key: value for key, value in vars(self.cov.config).items() if not key.startswith('_')}
+        return hashlib.sha256(json.dumps([IMPORT_CACHE_VERSION, config], sort_keys=True, default=str).encode()).hexdigest()
+
+    def pause_for_collection(self):
+        """Stop tracing until the end of collection if the import time coverage can come from the import cache.
+
+        The snapshot is only used if none of the files it was recorded from changed since.
+        """
+        self.imported_before = set(sys.modules)
+        if not self.cov_import_cache:
+            return
+        try:
+            snapshot = json.loads(self.import_cache_path().read_text())
+        except (OSError, ValueError):
+            return
+        if snapshot.get('key') != self.import_cache_key():
+            return
+        if any(_file_digest(filename) != digest for filename, digest in snapshot['modules'].items()):
+            return
+        self.import_snapshot = snapshot
+        self.cov.stop()
+
+    @_ensure_topdir
+    def collection_finished(self):
+        """Resume tracing and add the import time coverage from the cache, or record it in the cache for next runs."""
+        if not self.cov_import_cache or self.imported_before is None:
+            return
+        imported = {getattr(module, '__file__', None) for name, module in list(sys.modules.items()) if name not in self.imported_before}
+        imported = {os.path.realpath(filename) for filename in imported if filename and Path(filename).is_file()}
+        self.imported_before = None
+
+        snapshot = self.import_snapshot
+        if snapshot is not None:
+            self.import_snapshot = None
+            self.cov.start()
+            data = self.cov._data
+            if snapshot['arcs']:
+                data.add_arcs({filename: [tuple(arc) for arc in arcs] for filename, arcs in snapshot['arcs'].items()})
+            else:
+                data.add_lines(snapshot['lines'])
+            missed = imported - snapshot['modules'].keys()
+            if missed:
+                warnings.warn(
+                    CovImportCacheWarning(
+                        f'{len(missed)} modules imported during collection are not in the import cache, '
+                        'their import time coverage was not measured. The cache will be recorded again by the next run.'
+                    ),
+                    stacklevel=1,
+                )
+                self.import_cache_path().unlink(missing_ok=True)
+            return
+
+        # Everything measured so far happened while importing and collecting.
+        self.cov._collector.flush_data()
+        data = self.cov._data
+        measured = data.measured_files()
+        snapshot = {
+            'key': self.import_cache_key(),
+            'modules': {filename: _file_digest(filename) for filename in sorted(imported | measured)},
+            'lines': {},
+            'arcs': {},
+        }
+        for filename in measured:
+            if data.has_arcs():
+                snapshot['arcs'][filename] = sorted(data.arcs(filename) or ())
+            else:
+                snapshot['lines'][filename] = sorted(data.lines(filename) or ())
+        path = self.import_cache_path()
+        target = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        target.write_text(json.dumps(snapshot))
+        _replace(target, path)
+
+    def order_tests(self, items):
+        """Run first the tests that are most likely to exercise the lines changed since the ordering index was stored."""
+        index = self.cache.get(order.ORDER_CACHE_KEY, None) if self.cache is not None else None
+        if index is None:
+            return 0
+        return order.order_items(items, index, os.path.realpath(self.topdir))
+
+    def affinity_groups(self, items, workers):
+        """Return the xdist group of the tests, from the source file each executed the most in the previous run."""
+        index = self.cache.get(order.ORDER_CACHE_KEY, None) if self.cache is not None else None
+        if index is None:
+            return {}
+        return order.affinity_groups(items, index, os.path.realpath(self.topdir), workers)
+
+    @_ensure_topdir
+    def store_order_index(self, ran=()):
+        """Store which tests executed each line, for ordering the next runs.
+
+        The tests that did not run keep what they executed in the index stored by the previous runs.
+        """
+        if self.cache is None:
+            return
+        index = order.build_index(self.cov.get_data(), os.path.realpath(self.topdir))
+        previous = self.cache.get(order.ORDER_CACHE_KEY, None)
+        if previous is not None:
+            index = order.merge_index(previous, index, ran)
+        self.cache.set(order.ORDER_CACHE_KEY, index)
+
+    @contextlib.contextmanager
+    def timed_report(self, kind):
+        start = time.perf_counter()
+        yield
+        self.hook.pytest_cov_report_done(kind=kind, duration=time.perf_counter() - start)
+
+    def forget_rerun_tests(self):
+        """Remove from the data file of the previous run what the tests that ran again recorded in their contexts."""
+        data = CoverageData(os.path.abspath(self.cov.config.data_file))  # noqa: PTH100
+        if not Path(data.data_filename()).exists():
+            return
+        with data._connect() as con:
+            with con.execute('SELECT id, context FROM context') as cur:
+                forget = [(context_id,) for context_id, context in cur if context.rpartition('|')[0] in self.rerun_tests]
+            if forget:
+                con.execute_void('CREATE TEMP TABLE forget (id INTEGER PRIMARY KEY)')
+                con.executemany_void('INSERT INTO forget (id) VALUES (?)', forget)
+                con.execute_void('DELETE FROM line_bits WHERE context_id IN (SELECT id FROM forget)')
+                con.execute_void('DELETE FROM arc WHERE context_id IN (SELECT id FROM forget)')
+                con.execute_void('DELETE FROM context WHERE id IN (SELECT id FROM forget)')
+                con.execute_void('DROP TABLE forget')
+
+    def fold_contexts(self):
+        """Fold the contexts of the data files about to be combined, with --cov-append-merged.
+
+        Only the data of the run is folded, so the data file accumulated by the previous runs stays folded at no cost.
+        """
+        data = self.cov.get_data()
+        for filename in combinable_files(data.base_filename()):
+            if filename != os.path.abspath(data.data_filename()):  # noqa: PTH100
+                compact.fold(filename)
+
+    def combine(self):
+        """Combine the data files of the run into the data file."""
+        if self.cov_rerun:
+            self.forget_rerun_tests()
+        self.hook.pytest_cov_before_combine(cov=self.cov)
+        if self.cov_append_merged and not self.cov_rerun:
+            self.fold_contexts()
+        self.cov.combine()
+        self.cov.save()
+        self.hook.pytest_cov_after_combine(data=self.cov.get_data())
 
     @staticmethod
     def get_node_desc(platform, version_info):
@@ -147,12 +510,122 @@ class CovController:
             line += '\n\n'
             stream.write(line)
 
+    def report_fingerprint(self):
+        """Return a digest of the combined data, the reporting configuration and the measured sources."""
+        digest = hashlib.sha256()
+        config = {key: value for key, value in vars(self.cov.config).items() if not key.startswith('_')}
+        digest.update(json.dumps([self.cov_report, self.cov_precision, config], sort_keys=True, default=str).encode())
+
+        data = self.cov.get_data()
+        with_contexts = self.cov.config.show_contexts or self.cov.config.json_show_contexts
+        digest.update(json.dumps(sorted(data.measured_contexts())).encode())
+        for filename in sorted(data.measured_files()):
+            measured = sorted(data.arcs(filename) or ()) if data.has_arcs() else sorted(data.lines(filename) or ())
+            digest.update(json.dumps([filename, data.file_tracer(filename), measured]).encode())
+            if with_contexts:
+                digest.update(json.dumps(data.contexts_by_lineno(filename), sort_keys=True).encode())
+            try:
+                digest.update(Path(filename).read_bytes())
+            except OSError:
+                digest.update(b'\0missing')
+        return digest.hexdigest()
+
+    def _is_unchanged(self, report_type, destination, fingerprint, previous):
+        """Check if a previous run already wrote this report from identical inputs."""
+        if fingerprint is None or destination is None:
+            return False
+        return previous.get(report_type) == {'fingerprint': fingerprint, 'output': destination} and Path(destination).exists()
+
+    @_ensure_topdir
+    def partial_summary(self, stream):
+        """Write the total of an interrupted run, if it can be computed in time, and return it."""
+        result = []
+
+        def compute():
+            with _backup(self.cov, 'config'):
+                try:
+                    result.append(self.cov.report(ignore_errors=True, file=_NullFile))
+                except CoverageException:
+                    pass
+
+        thread = threading.Thread(target=compute, name='pytest-cov-partial', daemon=True)
+        thread.start()
+        thread.join(PARTIAL_TOTAL_TIMEOUT)
+
+        self.sep(stream, '_', 'coverage: interrupted')
+        stream.write(f'The coverage data collected until the interruption was saved in {self.cov.config.data_file}.\n')
+        if not result:
+            stream.write(f'The partial total was not computed within {PARTIAL_TOTAL_TIMEOUT} seconds.\n')
+            return None
+        precision = self.cov.config.precision if self.cov_precision is None else self.cov_precision
+        stream.write(f'TOTAL (partial): {display_covered(result[0], precision)}%\n')
+        return result[0]
+
+    def split_summary(self, stream):
+        """Write the terminal report (or the total) of each platform, from the data its workers returned."""
+        terminal = any(x in self.cov_report for x in ['term', 'term-missing'])
+        options = {
+            'show_missing': ('term-missing' in self.cov_report) or None,
+            'skip_covered': (isinstance(self.cov_report, dict) and 'skip-covered' in self.cov_report.values()) or None,
+            'ignore_errors': True,
+            'precision': self.cov_precision,
+        }
+        precision = self.cov.config.precision if self.cov_precision is None else self.cov_precision
+        with tempfile.TemporaryDirectory(prefix='pytest-cov-split-') as split_dir:
+            for index, node_desc in enumerate(sorted(self.split_data)):
+                # Older versions of coverage can only update an in-memory database once, so the data goes in a file.
+                data = CoverageData(os.path.join(split_dir, str(index)))  # noqa: PTH118
+                for dumped in self.split_data[node_desc]:
+                    worker_data = CoverageData(no_disk=True)
+                    worker_data.loads(dumped)
+                    data.update(worker_data)
+                data.close()
+                total, output = self._split_report(data.data_filename(), terminal, options)
+                self.split_totals[node_desc] = total
+                self.sep(stream, '_', f'coverage: {node_desc}')
+                stream.write(output if terminal else f'TOTAL: {display_covered(total, precision)}%\n')
+
+    def _split_report(self, data_file, terminal, options):
+        cov = coverage.Coverage(source=self.cov_source, branch=self.cov_branch, data_file=data_file, config_file=self.cov_config)
+        cov._warn_no_data = False
+        if self.split_paths is not None:
+            cov.config.paths = copy.deepcopy(self.split_paths)
+        cov.load()
+        output = StringIO()
+        total = cov.report(file=output if terminal else _NullFile, **options)
+        cov.get_data().close()
+        return total, output.getvalue()
+
+    def daemon_report(self, stream, options):
+        """Write the terminal report made by the coverage daemon from the data of all the runs it got, and return the total.
+
+        Returns None if the daemon can't make it, so the report is made here instead.
+        """
+        payload = {
+            'command': 'report',
+            'topdir': self.topdir,
+            'config_file': self.cov_config,
+            'source': self.cov_source,
+            'branch': self.cov_branch,
+            'data_file': os.path.abspath(self.cov.get_data().data_filename()),  # noqa: PTH100
+            'options': {key: options[key] for key in ('show_missing', 'skip_covered', 'precision')},
+        }
+        try:
+            response = daemon.request(Path(self.topdir, self.cov_daemon), payload)
+        except (OSError, CoverageException) as exc:
+            warnings.warn(CovReportWarning(f'Could not get the report from the coverage daemon, making it locally: {exc}'), stacklevel=1)
+            return None
+        stream.write(response['report'])
+        return response['total']
+
     @_ensure_topdir
     def summary(self, stream):
         """Produce coverage reports."""
         total = None
+        daemon_total = None
+        self.analyses = None
 
-        if not self.cov_report:
+        if not self.cov_report and not self.cov_compare:
             with _backup(self.cov, 'config'):
                 return self.cov.report(show_missing=True, ignore_errors=True, file=_NullFile)
 
@@ -171,6 +644,13 @@ class CovController:
             for node in self.failed_workers:
                 stream.write(f'{node.gateway.id}\n')
 
+        # Report on the workers whose data was recovered from their last checkpoint.
+        if self.recovered_workers:
+            self.sep(stream, '_', 'coverage: recovered workers')
+            stream.write('The following workers crashed, the data of their last checkpoint was combined.\n')
+            for node_id, files, lines in self.recovered_workers:
+                stream.write(f'{node_id}: {lines} lines in {files} files\n')
+
         # Produce terminal report if wanted.
         if any(x in self.cov_report for x in ['term', 'term-missing']):
             options = {
@@ -181,75 +661,204 @@ class CovController:
             }
             skip_covered = isinstance(self.cov_report, dict) and 'skip-covered' in self.cov_report.values()
             options.update({'skip_covered': skip_covered or None})
-            with _backup(self.cov, 'config'):
-                total = self.cov.report(**options)
-
-        # Produce annotated source code report if wanted.
-        if 'annotate' in self.cov_report:
-            annotate_dir = self.cov_report['annotate']
-
-            with _backup(self.cov, 'config'):
-                self.cov.annotate(ignore_errors=True, directory=annotate_dir)
-            # We need to call Coverage.report here, just to get the total
-            # Coverage.annotate don't return any total and we need it for --cov-fail-under.
-
+            with _backup(self.cov, 'config'), self.timed_report('term-missing' if options['show_missing'] else 'term'):
+                total = daemon_total = self.daemon_report(stream, options) if self.cov_daemon else None
+                if total is None:
+                    total = self.cov.report(**options)
+
+        # Report each platform separately if wanted.
+        if len(self.split_data) > 1:
+            self.split_summary(stream)
+
+        # Produce the report of the changed lines if wanted.
+        if 'diff' in self.cov_report:
+            base = self.cov_report['diff'] or diff.DEFAULT_BASE
+            self.sep(stream, '_', f'diff coverage: against {base}')
+            with _backup(self.cov, 'config'), self.timed_report('diff'):
+                try:
+                    self.diff_total = diff.diff_report(self.cov, self.report_analyses(), base, stream, self.cov_precision)
+                except CoverageException as exc:
+                    # Not being able to find the changes (outside a repository, in a shallow clone, ...) must not fail the run.
+                    warnings.warn(CovReportWarning(f'Could not produce the diff report against {base}: {exc}'), stacklevel=1)
+
+        # Compare with a previous run if wanted.
+        if self.cov_compare:
+            self.sep(stream, '_', f'coverage change: against {self.cov_compare}')
+            with _backup(self.cov, 'config'), self.timed_report('compare'):
+                compare.compare_report(self.cov, self.report_analyses(), self.cov_compare, self.cache, stream, self.cov_precision)
+
+        # Find out which file reports can be kept from a previous run.
+        fingerprint = None
+        previous = {}
+        if self.cov_reuse_reports and self.cache is not None:
+            fingerprint = self.report_fingerprint()
+            previous = self.cache.get(REPORTS_CACHE_KEY, {})
+
+        # Produce the file reports, then the ones of other packages, leaving the slow ones to a worker thread if wanted.
+        written = {}
+        deferred = []
+        custom = [report_type for report_type in self.cov_report if report_type in custom_reporters() and report_type not in FILE_REPORTS]
+        for report_type in [*FILE_REPORTS, *custom]:
+            if report_type not in self.cov_report:
+                continue
+            if self.cov_report_background and (report_type in BACKGROUND_REPORTS or report_type in custom):
+                deferred.append(report_type)
+                continue
+            report_total = self._file_report(report_type, stream, fingerprint, previous, written)
+            # The total of the daemon covers the previous runs too, the file reports only cover this one.
+            if report_total is not None and daemon_total is None:
+                total = report_total
+
+        # Some file reports were reused or deferred so the total still needs computing for --cov-fail-under,
+        # before the deferred reports start using the Coverage instance on the worker thread.
+        if total is None:
             with _backup(self.cov, 'config'):
                 total = self.cov.report(ignore_errors=True, file=_NullFile)
-            if annotate_dir:
-                stream.write(f'Coverage annotated source written to dir {annotate_dir}\n')
-            else:
-                stream.write('Coverage annotated source written next to source\n')
-
-        # Produce html report if wanted.
-        if 'html' in self.cov_report:
-            output = self.cov_report['html']
-            with _backup(self.cov, 'config'):
-                total = self.cov.html_report(ignore_errors=True, directory=output)
-            stream.write(f'Coverage HTML written to dir {self.cov.config.html_dir if output is None else output}\n')
 
-        # Produce xml report if wanted.
-        if 'xml' in self.cov_report:
-            output = self.cov_report['xml']
-            with _backup(self.cov, 'config'):
-                total = self.cov.xml_report(ignore_errors=True, outfile=output)
-            stream.write(f'Coverage XML written to file {self.cov.config.xml_output if output is None else output}\n')
+        if deferred:
+            self.background_stream = StringIO()
+            self.background_error = None
+            self.background_thread = threading.Thread(
+                target=self._background_reports,
+                args=(deferred, fingerprint, previous, written),
+                name='pytest-cov-reports',
+                daemon=True,
+            )
+            self.background_thread.start()
+        else:
+            self._store_fingerprints(fingerprint, previous, written)
 
-        # Produce json report if wanted
-        if 'json' in self.cov_report:
-            output = self.cov_report['json']
-            with _backup(self.cov, 'config'):
-                total = self.cov.json_report(ignore_errors=True, outfile=output)
-            stream.write('Coverage JSON written to file %s\n' % (self.cov.config.json_output if output is None else output))
+        return total
 
-        # Produce Markdown report if wanted.
-        if 'markdown' in self.cov_report:
-            output = self.cov_report['markdown']
-            with _backup(self.cov, 'config'):
-                with Path(output).open('w') as output_file:
-                    total = self.cov.report(ignore_errors=True, file=output_file, output_format='markdown')
-            stream.write(f'Coverage Markdown information written to file {output}\n')
+    def _file_report(self, report_type, stream, fingerprint, previous, written, atomic=False):
+        """Produce a single file report, unless a previous run already wrote it from identical inputs."""
+        output = self.cov_report[report_type]
+        if report_type in FILE_REPORTS:
+            default_output = FILE_REPORTS[report_type]
+            destination = getattr(self.cov.config, default_output) if output is None and default_output else output
+            message = REPORT_MESSAGES[report_type]
+            writer = getattr(self, f'_{report_type.replace("-", "_")}_report')
+        else:
+            output = destination = output or f'coverage.{report_type}'
+            message = f'Coverage {report_type} report written to file'
+            writer = functools.partial(self._custom_report, report_type)
+
+        if destination is None:
+            message = 'Coverage annotated source written next to source'
+        # Appending is never reused, every run needs to add its own data.
+        elif report_type != 'markdown-append' and self._is_unchanged(report_type, destination, fingerprint, previous):
+            stream.write(f'{message.replace("written to", "up to date in")} {destination}\n')
+            return None
+
+        with self.timed_report(report_type):
+            if atomic and destination is not None:
+                path = Path(self.topdir, destination)
+                # Keep the suffix, it selects the compression of streamed reports.
+                target = path.with_name(f'{path.stem}.{os.getpid()}.tmp{path.suffix}')
+                total = writer(str(target))
+                _replace(target, path)
+            else:
+                total = writer(output)
+        if report_type != 'markdown-append':
+            written[report_type] = destination
+        stream.write(f'{message} {destination}\n' if destination is not None else f'{message}\n')
+        return total
 
-        # Produce Markdown report if wanted, appending to output file
-        if 'markdown-append' in self.cov_report:
-            output = self.cov_report['markdown-append']
-            with _backup(self.cov, 'config'):
-                with Path(output).open('a') as output_file:
-                    total = self.cov.report(ignore_errors=True, file=output_file, output_format='markdown')
-            stream.write(f'Coverage Markdown information appended to file {output}\n')
+    def _store_fingerprints(self, fingerprint, previous, written):
+        if fingerprint is not None:
+            previous.update({report_type: {'fingerprint': fingerprint, 'output': output} for report_type, output in written.items()})
+            self.cache.set(REPORTS_CACHE_KEY, previous)
 
-        # Produce lcov report if wanted.
-        if 'lcov' in self.cov_report:
-            output = self.cov_report['lcov']
+    def _background_reports(self, report_types, fingerprint, previous, written):
+        try:
+            for report_type in report_types:
+                self._file_report(report_type, self.background_stream, fingerprint, previous, written, atomic=True)
+            self._store_fingerprints(fingerprint, previous, written)
+        except Exception as exc:
+            self.background_error = exc
+
+    def join_reports(self, stream):
+        """Wait for the file reports written in the background and output their messages.
+
+        Returns the exception that stopped the reports from being written, if any.
+        """
+        if self.background_thread is None:
+            return None
+        self.background_thread.join()
+        self.background_thread = None
+        stream.write(self.background_stream.getvalue())
+        return self.background_error
+
+    def _annotate_report(self, output):
+        with _backup(self.cov, 'config'):
+            self.cov.annotate(ignore_errors=True, directory=output)
+        # We need to call Coverage.report here, just to get the total
+        # Coverage.annotate don't return any total and we need it for --cov-fail-under.
+        with _backup(self.cov, 'config'):
+            return self.cov.report(ignore_errors=True, file=_NullFile)
+
+    def report_analyses(self):
+        """Return the (file reporter, analysis) pairs of the files to report.
+
+        The analysis is done once per summary, for the diff report, the comparison and the reporters of other packages.
+        """
+        if self.analyses is None:
             with _backup(self.cov, 'config'):
-                self.cov.lcov_report(ignore_errors=True, outfile=output)
-
-                # We need to call Coverage.report here, just to get the total
-                # Coverage.lcov_report doesn't return any total and we need it for --cov-fail-under.
-                total = self.cov.report(ignore_errors=True, file=_NullFile)
-
-            stream.write(f'Coverage LCOV written to file {self.cov.config.lcov_output if output is None else output}\n')
+                self.cov.config.ignore_errors = True
+                self.cov._prepare_data_for_reporting()
+                self.analyses = list(get_analysis_to_report(self.cov, None))
+        return self.analyses
+
+    def _custom_report(self, report_type, output):
+        reporter = custom_reporters()[report_type].load()
+        analyses = self.report_analyses()
+        Path(output).parent.mkdir(parents=True, exist_ok=True)
+        with _backup(self.cov, 'config'):
+            return reporter(self.cov, analyses, output)
+
+    def _binary_report(self, output):
+        with _backup(self.cov, 'config'):
+            return binary.write_binary_report(self.cov, output)
+
+    def _html_report(self, output):
+        with _backup(self.cov, 'config'):
+            return self.cov.html_report(ignore_errors=True, directory=output)
+
+    def _xml_report(self, output):
+        with _backup(self.cov, 'config'):
+            if self.cov_stream_reports:
+                return reports.render_report(self.cov, reports.StreamingXmlReporter, output or self.cov.config.xml_output)
+            return self.cov.xml_report(ignore_errors=True, outfile=output)
+
+    def _json_report(self, output):
+        with _backup(self.cov, 'config'):
+            if self.cov_stream_reports:
+                return reports.render_report(self.cov, reports.StreamingJsonReporter, output or self.cov.config.json_output)
+            return self.cov.json_report(ignore_errors=True, outfile=output)
+
+    def _ndjson_report(self, output):
+        with _backup(self.cov, 'config'):
+            return reports.render_report(self.cov, reports.NdjsonReporter, output)
+
+    def _markdown_report(self, output):
+        with _backup(self.cov, 'config'):
+            with Path(output).open('w') as output_file:
+                return self.cov.report(ignore_errors=True, file=output_file, output_format='markdown')
+
+    def _markdown_append_report(self, output):
+        with _backup(self.cov, 'config'):
+            with Path(output).open('a') as output_file:
+                return self.cov.report(ignore_errors=True, file=output_file, output_format='markdown')
+
+    def _lcov_report(self, output):
+        with _backup(self.cov, 'config'):
+            if self.cov_stream_reports:
+                return reports.render_report(self.cov, reports.StreamingLcovReporter, output or self.cov.config.lcov_output)
+            self.cov.lcov_report(ignore_errors=True, outfile=output)
 
-        return total
+            # We need to call Coverage.report here, just to get the total
+            # Coverage.lcov_report doesn't return any total and we need it for --cov-fail-under.
+            return self.cov.report(ignore_errors=True, file=_NullFile)
 
 
 class Central(CovController):
@@ -279,9 +888,12 @@ class Central(CovController):
         )
 
         # Erase or load any previous coverage data and start coverage.
-        if not self.cov_append:
+        if not (self.cov_append or self.cov_append_merged or self.cov_rerun):
             self.cov.erase()
         self.cov.start()
+        if self.cov_coalesce:
+            self.redirect_children()
+        self.pause_for_collection()
 
         super().start()
 
@@ -291,12 +903,12 @@ class Central(CovController):
         super().finish()
 
         self.cov.stop()
-        self.cov.save()
+        with self.source_inventory():
+            self.cov.save()
 
         self.cov = self.combining_cov
         self.cov.load()
-        self.cov.combine()
-        self.cov.save()
+        self.combine()
 
         node_desc = self.get_node_desc(sys.platform, sys.version_info)
         self.node_descs.add(node_desc)
@@ -329,11 +941,18 @@ class DistMaster(CovController):
             data_file=os.path.abspath(self.cov.config.data_file),  # noqa: PTH100
             config_file=self.cov_config,
         )
-        if not self.cov_append:
-            self.cov.erase()
         self.cov.start()
         self.cov.config.paths['source'] = [self.topdir]
 
+    def erase(self):
+        """Erase the data of previous runs.
+
+        This is done when the session starts rather than in :meth:`start`: the xdist workers load pytest-cov with the same
+        options and start a master too, which must not delete the data files of workers that crashed before them.
+        """
+        if not (self.cov_append or self.cov_append_merged or self.cov_rerun):
+            CoverageData(os.path.abspath(self.cov.config.data_file)).erase(parallel=True)  # noqa: PTH100
+
     def configure_node(self, node):
         """Workers need to know if they are collocated and what files have moved."""
 
@@ -344,6 +963,21 @@ class DistMaster(CovController):
                 'cov_master_rsync_roots': [str(root) for root in node.nodemanager.roots],
             }
         )
+        if self.cov_affinity:
+            node.workerinput['cov_affinity_workers'] = len(node.nodemanager.specs)
+        if self.cov_measure_workers is not None and getattr(self.config.option, 'dist', 'no') == 'each':
+            node.workerinput['cov_measure'] = self.measures(node)
+
+    def measures(self, node):
+        """Tell if a worker measures coverage with --cov-measure-workers: with --dist=each the workers run the same tests."""
+        if self.cov_measure_workers == 'per-platform':
+            rinfo = node.gateway._rinfo()
+            node_desc = self.get_node_desc(rinfo.platform, rinfo.version_info)
+            return self.measuring_workers.setdefault(node_desc, node.gateway.id) == node.gateway.id
+        return node.gateway.id in self.cov_measure_workers
+
+    def flush(self):
+        """The tests run in the workers, each of them flushes its own data."""
 
     def testnodedown(self, node, error):
         """Collect data file name from worker."""
@@ -352,7 +986,12 @@ class DistMaster(CovController):
         # plugin didn't get activated on the worker side.
         output = getattr(node, 'workeroutput', {})
         if 'cov_worker_node_id' not in output:
-            self.failed_workers.append(node)
+            if not self.recover_checkpoint(node):
+                self.failed_workers.append(node)
+            return
+
+        # Workers that ran untraced with --cov-measure-workers have no data.
+        if output.get('cov_worker_unmeasured'):
             return
 
         # If worker is not collocated then we must save the data file
@@ -371,23 +1010,70 @@ class DistMaster(CovController):
             cov_data.loads(output['cov_worker_data'])
             path = output['cov_worker_path']
             self.cov.config.paths['source'].append(path)
+            self.hook.pytest_cov_worker_data_received(node=node, size=len(output['cov_worker_data']))
+        else:
+            self.hook.pytest_cov_worker_data_received(node=node, size=None)
 
         # Record the worker types that contribute to the data file.
         rinfo = node.gateway._rinfo()
         node_desc = self.get_node_desc(rinfo.platform, rinfo.version_info)
         self.node_descs.add(node_desc)
 
+        # Keep the data of each worker type apart too, to report them separately.
+        if self.cov_split_platforms:
+            self.split_node_data(node_desc, output)
+
+    def split_node_data(self, node_desc, output):
+        """Keep the data returned by a worker, with the data of the subprocesses it started, for the report of its platform.
+
+        The data files are combined (and removed) before the reports are made, so their data is kept serialized.
+        """
+        if 'cov_worker_data' in output:
+            # The worker combined the data of its subprocesses already.
+            dumped = [output['cov_worker_data']]
+        else:
+            dumped = []
+            for key in ('cov_worker_data_file', 'cov_worker_children_data_file'):
+                if Path(output.get(key) or '').is_file():
+                    data = CoverageData(output[key])
+                    data.read()
+                    dumped.append(data.dumps())
+                    data.close()
+        if dumped:
+            self.split_data.setdefault(node_desc, []).extend(dumped)
+
+    def recover_checkpoint(self, node):
+        """Count what the last checkpoint of a crashed worker holds. It is combined with the other data files."""
+        data_file = Path(self.cov.config.data_file).absolute()
+        paths = list(data_file.parent.glob(f'{glob.escape(data_file.name)}.*.{glob.escape(node.gateway.id)}'))
+        if not self.cov_checkpoint or not paths:
+            return False
+        files = set()
+        lines = 0
+        for path in paths:
+            data = CoverageData(path)
+            try:
+                data.read()
+            except CoverageException:
+                continue
+            for filename in data.measured_files():
+                files.add(filename)
+                lines += len(data.lines(filename) or ())
+        self.recovered_workers.append((node.gateway.id, len(files), lines))
+        return True
+
     @_ensure_topdir
     def finish(self):
         """Combines coverage data and sets the list of coverage objects to report on."""
 
         # Combine all the suffix files into the data file.
         self.cov.stop()
-        self.cov.save()
+        with self.source_inventory():
+            self.cov.save()
+        self.split_paths = self.cov.config.paths
         self.cov = self.combining_cov
         self.cov.load()
-        self.cov.combine()
-        self.cov.save()
+        self.combine()
 
 
 class DistWorker(CovController):
@@ -409,16 +1095,22 @@ class DistWorker(CovController):
                 self.cov_source = [source.replace(master_topdir, worker_topdir) for source in self.cov_source]
             self.cov_config = self.cov_config.replace(master_topdir, worker_topdir)
 
-        # Erase any previous data and start coverage.
+        # Erase any previous data and start coverage. With checkpoints, the data file is named after the worker so the
+        # master can find it if the worker crashes.
         self.cov = coverage.Coverage(
             source=self.cov_source,
             branch=self.cov_branch,
-            data_suffix=True,
+            data_suffix=f'{filename_suffix(True)}.{self.nodeid}' if self.cov_checkpoint else True,
             config_file=self.cov_config,
         )
+        self.checkpointed_at = time.monotonic()
         # Prevent workers from issuing module-not-measured type of warnings (expected for a workers to not have coverage in all the files).
         self.cov._warn_unimported_source = False
         self.cov.start()
+        # With --cov-split-platforms the data of the subprocesses is told apart to report it with the platform of the worker.
+        if self.cov_coalesce or self.cov_split_platforms:
+            self.redirect_children()
+        self.pause_for_collection()
 
         super().start()
 
@@ -433,14 +1125,17 @@ class DistWorker(CovController):
             # We don't combine data if we're collocated - we can get
             # race conditions in the .combine() call (it's not atomic)
             # The data is going to be combined in the master.
-            self.cov.save()
+            with self.source_inventory():
+                self.cov.save()
 
             # If we are collocated then just inform the master of our
             # data file to indicate that we have finished.
             self.config.workeroutput['cov_worker_node_id'] = self.nodeid
+            self.config.workeroutput['cov_worker_data_file'] = self.cov.get_data().data_filename()
+            self.config.workeroutput['cov_worker_children_data_file'] = self.children_data_file
         else:
-            self.cov.combine()
-            self.cov.save()
+            with self.source_inventory():
+                self.combine()
             # If we are not collocated then add the current path
             # and coverage data to the output so we can combine
             # it on the master node.
@@ -456,5 +1151,12 @@ class DistWorker(CovController):
                 }
             )
 
+    def checkpoint(self):
+        """Write the data collected so far to the data file of the worker, at most every --cov-checkpoint seconds."""
+        if not self.started or time.monotonic() - self.checkpointed_at < self.cov_checkpoint:
+            return
+        self.cov._collector.flush_data()
+        self.checkpointed_at = time.monotonic()
+
     def summary(self, stream):
         """Only the master reports so do nothing."""
@@ -0,0 +1,52 @@
+"""Hooks called by pytest-cov around the coverage lifecycle.
+
+Implement them in a plugin or in a conftest.py like any other pytest hook, for example to profile the reports or to
+collect metrics about the combined data.
+"""
+
+import pytest
+
+
+@pytest.hookspec(historic=True)
+def pytest_cov_started(controller):
+    """Called when coverage measurement is started, in the main process and in xdist workers.
+
+    Coverage starts before conftest.py files are loaded, so this hook is historic: plugins registered later still get the
+    call when they are registered.
+
+    :param controller: The pytest-cov controller. ``controller.cov`` is the ``coverage.Coverage`` instance.
+    """
+
+
+def pytest_cov_worker_data_received(node, size):
+    """Called in the main process when an xdist worker finished and handed over its coverage data.
+
+    :param node: The xdist worker node.
+    :param size: The size in bytes of the data sent by a worker that does not share the filesystem of the main
+        process, or None if the worker wrote its data file directly.
+    """
+
+
+def pytest_cov_before_combine(cov):
+    """Called before the data files of the run are combined.
+
+    :param cov: The ``coverage.Coverage`` instance that combines the data and that the reports are produced from.
+    """
+
+
+def pytest_cov_after_combine(data):
+    """Called after the data files of the run are combined and saved.
+
+    :param data: The combined ``coverage.CoverageData``.
+    """
+
+
+def pytest_cov_report_done(kind, duration):
+    """Called after each report is produced. Reports reused with ``--cov-reuse-reports`` are not included.
+
+    With ``--cov-report-background`` this is called from the background thread for the reports written there.
+
+    :param kind: The report type, as given to ``--cov-report`` (for example ``"term-missing"`` or ``"html"``), or
+        ``"compare"`` for ``--cov-compare``.
+    :param duration: The time taken, in seconds.
+    """
@@ -0,0 +1,95 @@
+"""A cache of the Python files in the source directories, for finding the files that were never executed.
+
+When coverage saves its data it walks the directories given with ``--cov`` to find the files that were never imported, so
+they are reported as 0%. With many files or slow storage this takes long, and every xdist worker does it. The inventory
+records the modification time and the entries of each directory: a directory is only listed again when its modification
+time changed (files were added, removed or renamed in it), and the directories that need it are listed in parallel.
+"""
+
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+INVENTORY_VERSION = 1
+SCAN_THREADS = 16
+# A directory changed shortly after it was listed may not get a new modification time on filesystems with a coarse clock.
+RACY_NS = 2_000_000_000
+# Same as coverage.files.find_python_files: the files with other characters couldn't have been imported.
+PYTHON_FILE_RE = re.compile(r'^[^.#~!$@%^&*()+=,]+\.pyw?$')
+
+
+class Inventory:
+    """The entries of the source directories, stored in a JSON file between runs."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        try:
+            cached = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            cached = {}
+        self.dirs = cached.get('dirs', {}) if cached.get('version') == INVENTORY_VERSION else {}
+        self.visited = set()
+        self.changed = False
+
+    def scan(self, dirpath):
+        """Return the subdirectories and the files of a directory, listing it only if it changed since it was cached."""
+        self.visited.add(dirpath)
+        try:
+            mtime = os.stat(dirpath).st_mtime_ns  # noqa: PTH116
+        except OSError:
+            return [], []
+        cached = self.dirs.get(dirpath)
+        if cached is not None and cached['mtime'] == mtime:
+            return cached['dirs'], cached['files']
+
+        dirs = []
+        files = []
+        try:
+            with os.scandir(dirpath) as entries:
+                for entry in entries:
+                    # Like os.walk: symlinks to directories are not followed, the other entries are files.
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if not is_dir:
+                        files.append(entry.name)
+                    elif not entry.is_symlink():
+                        dirs.append(entry.name)
+        except OSError:
+            return [], []
+        self.changed = True
+        if time.time_ns() - mtime > RACY_NS:
+            self.dirs[dirpath] = {'mtime': mtime, 'dirs': dirs, 'files': files}
+        else:
+            self.dirs.pop(dirpath, None)
+        return dirs, files
+
+    def find_python_files(self, dirname, include_namespace_packages):
+        """Yield the importable Python files in `dirname`, like ``coverage.files.find_python_files``.
+
+        The directories are scanned a level at a time, in parallel.
+        """
+        level = [(dirname, True)]
+        with ThreadPoolExecutor(SCAN_THREADS, 'pytest-cov-inventory') as executor:
+            while level:
+                next_level = []
+                for (dirpath, top), (dirs, files) in zip(level, executor.map(self.scan, [dirpath for dirpath, _ in level])):
+                    # The files of a directory without __init__.py (other than `dirname`) can't be imported.
+                    if not (top or include_namespace_packages or '__init__.py' in files):
+                        continue
+                    yield from (os.path.join(dirpath, filename) for filename in files if PYTHON_FILE_RE.match(filename))  # noqa: PTH118
+                    next_level.extend((os.path.join(dirpath, name), False) for name in dirs)  # noqa: PTH118
+                level = next_level
+
+    def save(self):
+        """Store the directories scanned by this process, if any of them had to be listed."""
+        if not self.changed:
+            return
+        dirs = {dirpath: entry for dirpath, entry in self.dirs.items() if dirpath in self.visited}
+        target = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+        target.write_text(json.dumps({'version': INVENTORY_VERSION, 'dirs': dirs}))
+        target.replace(self.path)
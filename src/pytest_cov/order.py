@@ -0,0 +1,137 @@
+"""Coverage-guided test ordering and grouping."""
+
+import math
+import os
+from collections import Counter
+
+from coverage.exceptions import CoverageException
+
+from . import diff
+
+ORDER_CACHE_KEY = 'cov/order'
+
+
+def _test_id(nodeid):
+    # xdist adds the group to the node id of the tests marked with xdist_group when using --dist=loadgroup.
+    if nodeid.rfind('@') > nodeid.rfind(']'):
+        return nodeid.rpartition('@')[0]
+    return nodeid
+
+
+def build_index(data, topdir):
+    """Return which tests executed each line, from data measured with ``--cov-context=test``.
+
+    Tests are stored once in a table and referred to by their position, files by their path relative to `topdir`. The
+    commit is recorded so the next runs can find the lines changed since.
+    """
+    tests = {}
+    files = {}
+    for filename in data.measured_files():
+        lines = {}
+        for line, contexts in data.contexts_by_lineno(filename).items():
+            ids = {tests.setdefault(_test_id(context.rpartition('|')[0]), len(tests)) for context in contexts if context}
+            if ids:
+                lines[line] = sorted(ids)
+        if lines:
+            files[os.path.relpath(filename, topdir)] = lines
+    try:
+        commit = diff.run_git('rev-parse', 'HEAD', cwd=topdir).strip()
+    except CoverageException:
+        commit = None
+    return {'commit': commit, 'tests': list(tests), 'files': files}
+
+
+def merge_index(previous, index, ran):
+    """Add to `index` what `previous` recorded for the tests that did not run this time.
+
+    Runs of a subset of the tests (with ``-k``, ``--lf``, ...) would otherwise make the next run consider all the other
+    tests new. The tests in `ran` that executed nothing are kept as known tests without lines.
+    """
+    ran = {_test_id(nodeid) for nodeid in ran} | set(index['tests'])
+    tests = {test: position for position, test in enumerate(index['tests'])}
+    for test in ran:
+        tests.setdefault(test, len(tests))
+    previous_tests = previous['tests']
+    for test in previous_tests:
+        if test not in ran:
+            tests.setdefault(test, len(tests))
+
+    for filename, lines in previous['files'].items():
+        merged = index['files'].get(filename, {})
+        for line, ids in lines.items():
+            kept = {tests[previous_tests[test]] for test in ids if previous_tests[test] not in ran}
+            if kept:
+                # The line numbers are strings once the index went through the cache.
+                merged[int(line)] = sorted(kept.union(merged.get(int(line), ())))
+        if merged:
+            index['files'][filename] = merged
+    index['tests'] = list(tests)
+    return index
+
+
+def order_items(items, index, topdir):
+    """Sort the items in place so the tests most likely to exercise the changes run first.
+
+    Tests that are not in the index (new tests) come first, then the tests that executed the most changed lines, then the
+    ones that executed the most lines of changed files. Only the changed files are looked up in the index. Returns the
+    number of tests moved ahead.
+    """
+    changed = {}
+    if index.get('commit'):
+        try:
+            _, changed = diff.changed_lines(index['commit'], topdir)
+        except CoverageException:
+            pass
+
+    known = set(index['tests'])
+    changed_hits = [0] * len(index['tests'])
+    file_hits = [0] * len(index['tests'])
+    for filename, lines in changed.items():
+        for line, ids in index['files'].get(os.path.relpath(filename, topdir), {}).items():
+            for test in ids:
+                file_hits[test] += 1
+                if int(line) in lines:
+                    changed_hits[test] += 1
+    scores = {index['tests'][test]: (changed_hits[test], file_hits[test]) for test in range(len(index['tests'])) if file_hits[test]}
+
+    def key(item):
+        nodeid = _test_id(item.nodeid)
+        if nodeid not in known:
+            return 0, 0, 0
+        changed_hit, file_hit = scores.get(nodeid, (0, 0))
+        return 1 if changed_hit or file_hit else 2, -changed_hit, -file_hit
+
+    keys = {item.nodeid: key(item) for item in items}
+    items.sort(key=lambda item: keys[item.nodeid])
+    return sum(1 for value in keys.values() if value[0] < 2)
+
+
+def affinity_groups(items, index, topdir, workers):
+    """Return the group of each item that is in the index: the source file it executed the most lines of.
+
+    The file of the test itself is not counted. Groups larger than a worker's share of the tests are split in chunks, so
+    the workers can still balance the load.
+    """
+    touched = [Counter() for _ in index['tests']]
+    for filename, lines in index['files'].items():
+        for ids in lines.values():
+            for test in ids:
+                touched[test][filename] += 1
+    positions = {nodeid: position for position, nodeid in enumerate(index['tests'])}
+
+    size = max(1, math.ceil(len(items) / workers))
+    counts = Counter()
+    groups = {}
+    for item in items:
+        test = positions.get(_test_id(item.nodeid))
+        if test is None:
+            continue
+        own = os.path.relpath(item.path, topdir)
+        candidates = [(-count, filename) for filename, count in touched[test].items() if filename != own]
+        if not candidates:
+            continue
+        _, filename = min(candidates)
+        chunk = counts[filename] // size
+        counts[filename] += 1
+        groups[item.nodeid] = f'cov:{filename}' if not chunk else f'cov:{filename}:{chunk}'
+    return groups
@@ -1,8 +1,12 @@
 """Coverage plugin for pytest."""
 
 import argparse
+import functools
 import os
 import re
+import signal
+import threading
+import time
 import warnings
 from io import StringIO
 from pathlib import Path
@@ -13,6 +17,7 @@ import pytest
 from . import CovDisabledWarning
 from . import CovReportWarning
 from . import PytestCovWarning
+from .registry import custom_reporters
 
 if TYPE_CHECKING:
     from .engine import CovController
@@ -24,10 +29,11 @@ COVERAGE_SQLITE_WARNING_RE2 = re.compile('unclosed\\ database\\ in\\ <sqlite3\\.
 
 
 def validate_report(arg):
-    file_choices = ['annotate', 'html', 'xml', 'json', 'markdown', 'markdown-append', 'lcov']
+    file_choices = ['annotate', 'html', 'xml', 'json', 'ndjson', 'markdown', 'markdown-append', 'lcov', 'binary']
+    file_choices += [name for name in custom_reporters() if name not in file_choices]
     term_choices = ['term', 'term-missing']
     term_modifier_choices = ['skip-covered']
-    all_choices = term_choices + file_choices
+    all_choices = [*term_choices, *file_choices, 'diff']
     values = arg.split(':', 1)
     report_type = values[0]
     if report_type not in [*all_choices, '']:
@@ -41,6 +47,9 @@ def validate_report(arg):
     if report_type in term_choices and report_modifier in term_modifier_choices:
         return report_type, report_modifier
 
+    if report_type == 'diff':
+        return report_type, report_modifier
+
     if report_type not in file_choices:
         msg = f'output specifier not supported for: "{arg}" (choose from "{file_choices}")'
         raise argparse.ArgumentTypeError(msg)
@@ -63,6 +72,35 @@ def validate_fail_under(num_str):
     return value
 
 
+def validate_seconds(arg):
+    try:
+        value = float(arg)
+    except ValueError:
+        raise argparse.ArgumentTypeError('An integer or float value is required.') from None
+    if value <= 0:
+        raise argparse.ArgumentTypeError('The value must be greater than 0.')
+    return value
+
+
+def validate_tests(arg):
+    try:
+        value = int(arg)
+    except ValueError:
+        raise argparse.ArgumentTypeError('An integer value is required.') from None
+    if value <= 0:
+        raise argparse.ArgumentTypeError('The value must be greater than 0.')
+    return value
+
+
+def validate_measure_workers(arg):
+    if arg == 'per-platform':
+        return arg
+    workers = [worker.strip() for worker in arg.split(',') if worker.strip()]
+    if not workers:
+        raise argparse.ArgumentTypeError('Use "per-platform" or a comma separated list of worker ids (like "gw0,gw3").')
+    return workers
+
+
 def validate_context(arg):
     if arg != 'test':
         raise argparse.ArgumentTypeError('The only supported value is "test".')
@@ -77,6 +115,10 @@ class StoreReport(argparse.Action):
         # coverage.py doesn't set a default file for markdown output_format
         if report_type in ['markdown', 'markdown-append'] and file is None:
             namespace.cov_report[report_type] = 'coverage.md'
+        if report_type == 'ndjson' and file is None:
+            namespace.cov_report[report_type] = 'coverage.ndjson'
+        if report_type == 'binary' and file is None:
+            namespace.cov_report[report_type] = 'coverage.bin'
         if all(x in namespace.cov_report for x in ['markdown', 'markdown-append']):
             self._validate_markdown_dest_files(namespace.cov_report, parser)
 
@@ -118,10 +160,12 @@ def pytest_addoption(parser):
         metavar='TYPE',
         type=validate_report,
         help='Type of report to generate: term, term-missing, '
-        'annotate, html, xml, json, markdown, markdown-append, lcov (multi-allowed). '
+        'annotate, html, xml, json, ndjson, markdown, markdown-append, lcov, binary, diff (multi-allowed). '
         'term, term-missing may be followed by ":skip-covered". '
-        'annotate, html, xml, json, markdown, markdown-append and lcov may be followed by ":DEST" '
+        'annotate, html, xml, json, ndjson, markdown, markdown-append, lcov and binary may be followed by ":DEST" '
         'where DEST specifies the output location. '
+        'diff may be followed by ":BASE" where BASE is the git ref the changed lines are found from (default: origin/main). '
+        'Report types registered by other packages in the "pytest_cov.reporters" entry point group can be used as well. '
         'Use --cov-report= to not generate any output.',
     )
     group.addoption(
@@ -150,12 +194,59 @@ def pytest_addoption(parser):
         type=validate_fail_under,
         help='Fail if the total coverage is less than MIN.',
     )
+    group.addoption(
+        '--cov-diff-fail-under',
+        action='store',
+        metavar='MIN',
+        type=validate_fail_under,
+        help='Fail if the coverage of the changed lines is less than MIN. Needs --cov-report=diff.',
+    )
     group.addoption(
         '--cov-append',
         action='store_true',
         default=False,
         help='Do not delete coverage but append to current. Default: False',
     )
+    group.addoption(
+        '--cov-append-merged',
+        action='store_true',
+        default=False,
+        help='Like --cov-append, but fold the contexts of the data of each run before appending it, so the data file keeps a '
+        'single set of lines per source file however many runs and tests were appended. Default: False',
+    )
+    group.addoption(
+        '--cov-rerun',
+        action='store_true',
+        default=False,
+        help='Keep the coverage of the previous run, replacing the coverage of the tests that run again (for example '
+        'with --lf). Implies --cov-context=test. Default: False',
+    )
+    group.addoption(
+        '--cov-coalesce',
+        action='store_true',
+        default=False,
+        help='Combine the data files of the subprocesses started by the tests while the tests run, in each xdist worker '
+        'or in the main process. Default: False',
+    )
+    group.addoption(
+        '--cov-checkpoint',
+        action='store',
+        metavar='SECONDS',
+        type=validate_seconds,
+        default=None,
+        help='Save the data of the xdist workers to disk every SECONDS while the tests run, so the coverage of workers '
+        'that crash is not lost.',
+    )
+    group.addoption(
+        '--cov-flush-every',
+        action='store',
+        metavar='N',
+        type=validate_tests,
+        default=None,
+        help='Write the data collected so far to the data file and free it every N tests, in the main process or in each '
+        'xdist worker, to bound the memory used by long sessions. Does not bound memory with --cov-context=test: coverage '
+        'already writes the data at every context switch.',
+    )
     group.addoption(
         '--cov-branch',
         action='store_true',
@@ -175,6 +266,100 @@ def pytest_addoption(parser):
         type=validate_context,
         help='Dynamic contexts to use. "test" for now.',
     )
+    group.addoption(
+        '--cov-reuse-reports',
+        action='store_true',
+        default=False,
+        help='Do not rewrite file reports when the combined data, reporting configuration and measured sources '
+        'are unchanged since the run that wrote them. Default: False',
+    )
+    group.addoption(
+        '--cov-report-background',
+        action='store_true',
+        default=False,
+        help='Write the annotate, html, xml, json and lcov reports on a background thread while the session finishes. '
+        'The total (and --cov-fail-under) is computed beforehand. Default: False',
+    )
+    group.addoption(
+        '--cov-stream-reports',
+        action='store_true',
+        default=False,
+        help='Write the xml, json and lcov reports one source file at a time instead of building them in memory. '
+        'Destinations ending in ".gz" are gzip-compressed. Default: False',
+    )
+    group.addoption(
+        '--cov-order',
+        action='store',
+        choices=['new-lines-first'],
+        default=None,
+        help='Reorder the tests so the ones that execute the most lines changed since the previous run with --cov-context=test '
+        'run first (new tests before them).',
+    )
+    group.addoption(
+        '--cov-affinity',
+        action='store_true',
+        default=False,
+        help='With pytest-xdist, send the tests that mostly execute the same source file in the previous run with '
+        '--cov-context=test to the same worker. Default: False',
+    )
+    group.addoption(
+        '--cov-split-platforms',
+        action='store_true',
+        default=False,
+        help='With pytest-xdist workers on several platforms or Python versions, also report the coverage of each of them '
+        'separately. Default: False',
+    )
+    group.addoption(
+        '--cov-measure-workers',
+        action='store',
+        metavar='WORKERS',
+        type=validate_measure_workers,
+        help='With pytest-xdist and --dist=each, only measure coverage on one worker per platform ("per-platform") or on '
+        'the workers in a comma separated list of ids (like "gw0,gw3"). The other workers run the tests untraced.',
+    )
+    group.addoption(
+        '--cov-daemon',
+        action='store',
+        nargs='?',
+        const='.coverage-daemon.sock',
+        metavar='SOCKET',
+        help='Get the terminal report from the pytest-cov-daemon listening on SOCKET (default: .coverage-daemon.sock), '
+        'which merges the data of each run with the previous ones and keeps the parsed sources between runs.',
+    )
+    group.addoption(
+        '--cov-import-cache',
+        action='store_true',
+        default=False,
+        help='Do not trace importing and collecting tests when none of the imported files changed since the previous run, '
+        'reuse the coverage recorded then instead. Default: False',
+    )
+    group.addoption(
+        '--cov-source-inventory',
+        action='store_true',
+        default=False,
+        help='Cache the list of the source files that can be reported as never executed, and only list again the source '
+        'directories that changed since the previous run, in parallel. Default: False',
+    )
+    group.addoption(
+        '--cov-overhead-report',
+        action='store_true',
+        default=False,
+        help='Show the tests and source files that coverage records the most lines (or arcs) for while running tests. Default: False',
+    )
+    group.addoption(
+        '--cov-compare',
+        action='store',
+        metavar='PATH',
+        default=None,
+        help='Show the coverage changes against a previous data file, or against the previous run with "cache" '
+        '(the summary of each run is stored in the pytest cache).',
+    )
+
+
+def pytest_addhooks(pluginmanager):
+    from . import hookspec
+
+    pluginmanager.add_hookspecs(hookspec)
 
 
 def _prepare_cov_source(cov_source):
@@ -230,6 +415,10 @@ class CovPlugin:
         self._start_path = None
         self._disabled = False
         self.options = options
+        self._pluginmanager = pluginmanager
+        self._moved_first = 0
+        self._interrupted = False
+        self._collection_failed = False
         self._wrote_heading = False
 
         is_dist = getattr(options, 'numprocesses', False) or getattr(options, 'distload', False) or getattr(options, 'dist', 'no') != 'no'
@@ -242,6 +431,8 @@ class CovPlugin:
         elif len(self.options.cov_report) == 1 and '' in self.options.cov_report:
             self.options.cov_report = {}
         self.options.cov_source = _prepare_cov_source(self.options.cov_source)
+        if getattr(self.options, 'cov_rerun', False):
+            self.options.cov_context = 'test'
 
         # import engine lazily here to avoid importing
         # it for unit tests that don't need it
@@ -259,6 +450,7 @@ class CovPlugin:
             # fake config option for engine
             class Config:
                 option = self.options
+                hook = self._pluginmanager.hook
 
             config = Config()
 
@@ -275,8 +467,12 @@ class CovPlugin:
     def _is_worker(self, session):
         return getattr(session.config, 'workerinput', None) is not None
 
+    @pytest.hookimpl(tryfirst=True)
     def pytest_sessionstart(self, session):
-        """At session start determine our implementation and delegate to it."""
+        """At session start determine our implementation and delegate to it.
+
+        This runs before xdist starts the workers.
+        """
 
         if self.options.no_cov:
             # Coverage can be disabled because it does not cooperate with debuggers well.
@@ -290,12 +486,47 @@ class CovPlugin:
         self.pid = os.getpid()
         if self._is_worker(session):
             nodeid = session.config.workerinput.get('workerid', session.nodeid)
+            if not session.config.workerinput.get('cov_measure', True):
+                # Another worker measures the same tests (--cov-measure-workers), stop what the plugin started on load.
+                if self.cov_controller is not None:
+                    self.cov_controller.cov.stop()
+                    self.cov_controller = None
+                self._disabled = True
+                session.config.workeroutput.update({'cov_worker_node_id': nodeid, 'cov_worker_unmeasured': True})
+                return
             self.start(engine.DistWorker, session.config, nodeid)
         elif not self._started:
             self.start(engine.Central)
+        elif isinstance(self.cov_controller, engine.DistMaster):
+            self.cov_controller.erase()
+            # The workers start a master on load too, before they know they are workers: only this one is announced.
+            session.config.hook.pytest_cov_started.call_historic(kwargs={'controller': self.cov_controller})
+        self.cov_controller.cache = getattr(session.config, 'cache', None)
+        # The tests can only be grouped by the load schedulers, the other ones keep their own distribution.
+        self.cov_controller.cov_affinity &= session.config.getoption('dist', 'no') in ('load', 'loadgroup')
 
         if self.options.cov_context == 'test':
             session.config.pluginmanager.register(TestContextPlugin(self.cov_controller), '_cov_contexts')
+        if self.options.cov_overhead_report:
+            session.config.pluginmanager.register(OverheadPlugin(self.cov_controller, session.config), '_cov_overhead')
+        if 'cov_affinity_workers' in getattr(session.config, 'workerinput', {}):
+            session.config.option.loadgroup = True
+            affinity = AffinityPlugin(self.cov_controller, session.config.workerinput['cov_affinity_workers'])
+            session.config.pluginmanager.register(affinity, '_cov_affinity')
+
+    @pytest.hookimpl(trylast=True)
+    def pytest_collection_modifyitems(self, items):
+        if not self._disabled and self.cov_controller is not None and self.options.cov_order:
+            self._moved_first = self.cov_controller.order_tests(items)
+
+    def pytest_report_collectionfinish(self):
+        if self._moved_first:
+            return f'coverage: {self._moved_first} tests affected by the changes moved first'
+        return None
+
+    def pytest_collection_finish(self, session):
+        if not self._disabled and self.cov_controller is not None:
+            self.cov_controller.collection_finished()
 
     @pytest.hookimpl(optionalhook=True)
     def pytest_configure_node(self, node):
@@ -306,6 +537,18 @@ class CovPlugin:
         if not self._disabled:
             self.cov_controller.configure_node(node)
 
+    @pytest.hookimpl(optionalhook=True, tryfirst=True)
+    def pytest_xdist_make_scheduler(self, config, log):
+        """Group the tests on the workers with --cov-affinity.
+
+        Mark this hook as optional in case xdist is not installed.
+        """
+        if not self._disabled and self.cov_controller is not None and self.cov_controller.cov_affinity:
+            from xdist.scheduler import LoadGroupScheduling
+
+            return LoadGroupScheduling(config, log)
+        return None
+
     @pytest.hookimpl(optionalhook=True)
     def pytest_testnodedown(self, node, error):
         """Delegate to our implementation.
@@ -315,8 +558,30 @@ class CovPlugin:
         if not self._disabled:
             self.cov_controller.testnodedown(node, error)
 
+    def pytest_collectreport(self, report):
+        if report.failed:
+            self._collection_failed = True
+
+    def _interrupt_on_sigterm(self):
+        """Handle SIGTERM (sent by most CI timeouts) like an interruption, unless something else handles it already.
+
+        The processes forked by the tests inherit the handler, they are terminated like they would be without it.
+        """
+        pid = self.pid
+
+        def interrupt(signum, frame):
+            if os.getpid() != pid:
+                signal.signal(signum, signal.SIG_DFL)
+                os.kill(os.getpid(), signum)
+                return
+            raise KeyboardInterrupt('SIGTERM')
+
+        if threading.current_thread() is not threading.main_thread() or signal.getsignal(signal.SIGTERM) is not signal.SIG_DFL:
+            return None
+        return signal.signal(signal.SIGTERM, interrupt)
+
     def _should_report(self):
-        needed = self.options.cov_report or self.options.cov_fail_under
+        needed = self.options.cov_report or self.options.cov_fail_under or self.options.cov_compare
         return needed and not (self.failed and self.options.no_cov_on_fail)
 
     # we need to wrap pytest_runtestloop. by the time pytest_sessionfinish
@@ -345,11 +610,34 @@ class CovPlugin:
         else:
             warnings.simplefilter('once', CoverageWarning)
 
-        result = yield
+        # The workers are stopped by the controlling process, which reports.
+        previous_sigterm = None if self._is_worker(session) else self._interrupt_on_sigterm()
+        try:
+            result = yield
+        except KeyboardInterrupt:
+            if self._collection_failed and not session.config.option.continue_on_collection_errors:
+                # pytest stops before running the tests when collection failed, this is not a partial run.
+                raise
+            # Also raised for xdist's -x and --maxfail, and by the SIGTERM handler.
+            self._interrupted = True
+            if self.cov_controller is not None:
+                self.cov_controller.finish()
+                if not self._is_worker(session) and self._should_report():
+                    self.cov_total = self.cov_controller.partial_summary(self.cov_report)
+            raise
+        finally:
+            if previous_sigterm is not None:
+                signal.signal(signal.SIGTERM, previous_sigterm)
 
         self.failed = bool(session.testsfailed)
         if self.cov_controller is not None:
             self.cov_controller.finish()
+            if (
+                (self.options.cov_order or self.options.cov_affinity)
+                and self.options.cov_context == 'test'
+                and not self._is_worker(session)
+            ):
+                self.cov_controller.store_order_index([item.nodeid for item in session.items])
 
         if not self._is_worker(session) and self._should_report():
             # import coverage lazily here to avoid importing
@@ -368,6 +656,17 @@ class CovPlugin:
             assert self.cov_total is not None, 'Test coverage should never be `None`'
             cov_fail_under = self.options.cov_fail_under
             cov_precision = self.options.cov_precision
+            cov_diff_fail_under = self.options.cov_diff_fail_under
+            diff_total = self.cov_controller.diff_total
+            if cov_diff_fail_under is not None and diff_total is not None and not self.options.collectonly:
+                if should_fail_under(diff_total, cov_diff_fail_under, cov_precision):
+                    message = 'Coverage failure: changed lines total of {total} is less than diff-fail-under={fail_under:.{p}f}'.format(
+                        total=display_covered(diff_total, cov_precision),
+                        fail_under=cov_diff_fail_under,
+                        p=cov_precision,
+                    )
+                    session.config.pluginmanager.getplugin('terminalreporter').write(f'\nERROR: {message}\n', red=True, bold=True)
+                    session.testsfailed += 1
             if cov_fail_under is None or self.options.collectonly:
                 return
             if should_fail_under(self.cov_total, cov_fail_under, cov_precision):
@@ -398,7 +697,7 @@ class CovPlugin:
         if self.cov_controller is None:
             return
 
-        if self.cov_total is None:
+        if self.cov_total is None and not self._interrupted:
             # we shouldn't report, or report generation failed (error raised above)
             return
 
@@ -408,7 +707,7 @@ class CovPlugin:
             self.write_heading(terminalreporter)
             terminalreporter.write(report)
 
-        if self.options.cov_fail_under is not None and self.options.cov_fail_under > 0:
+        if self.options.cov_fail_under is not None and self.options.cov_fail_under > 0 and not self._interrupted:
             self.write_heading(terminalreporter)
             failed = self.cov_total < self.options.cov_fail_under
             markup = {'red': True, 'bold': True} if failed else {'green': True}
@@ -420,9 +719,36 @@ class CovPlugin:
             )
             terminalreporter.write(message, **markup)
 
+    def pytest_unconfigure(self, config):
+        if self.cov_controller is None:
+            return
+        terminalreporter = config.pluginmanager.getplugin('terminalreporter')
+        stream = StringIO()
+        error = self.cov_controller.join_reports(stream)
+        if terminalreporter is None:
+            return
+        if stream.getvalue():
+            terminalreporter.write(stream.getvalue())
+        if error is not None:
+            terminalreporter.write(f'WARNING: Failed to generate report: {error}\n', red=True, bold=True)
+
+    def pytest_runtest_logreport(self, report):
+        if self.options.cov_rerun and report.when == 'setup' and self.cov_controller is not None:
+            self.cov_controller.rerun_tests.add(report.nodeid)
+
+    def pytest_runtest_logfinish(self):
+        if self.cov_controller is None:
+            return
+        if self.options.cov_coalesce:
+            self.cov_controller.coalesce(force=False)
+        if self.options.cov_checkpoint:
+            self.cov_controller.checkpoint()
+        if self.options.cov_flush_every:
+            self.cov_controller.flush()
+
     @pytest.hookimpl(hookwrapper=True)
     def pytest_runtest_call(self, item):
-        if item.get_closest_marker('no_cover') or 'no_cover' in getattr(item, 'fixturenames', ()):
+        if self.cov_controller is not None and (item.get_closest_marker('no_cover') or 'no_cover' in getattr(item, 'fixturenames', ())):
             self.cov_controller.pause()
             yield
             self.cov_controller.resume()
@@ -450,6 +776,92 @@ class TestContextPlugin:
             self.cov_controller.cov.switch_context(f'{item.nodeid}|{when}')
 
 
+class AffinityPlugin:
+    """Mark the tests with the source file they executed the most in the previous run, on xdist workers.
+
+    The markers are added before xdist appends the groups to the node ids, and the tests that already have an
+    ``xdist_group`` marker keep it.
+    """
+
+    cov_controller: 'CovController'
+
+    def __init__(self, cov_controller, workers):
+        self.cov_controller = cov_controller
+        self.workers = workers
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_collection_modifyitems(self, items):
+        groups = self.cov_controller.affinity_groups(items, self.workers)
+        for item in items:
+            if item.nodeid in groups and item.get_closest_marker('xdist_group') is None:
+                item.add_marker(pytest.mark.xdist_group(groups[item.nodeid]))
+
+
+class OverheadPlugin:
+    """Record what coverage traces in the run phase of each test, to find the tests and files that cost the most.
+
+    The tracers don't count their events, so the cost is measured with the number of distinct lines (or arcs) recorded:
+    the data collected so far is flushed before each test runs, then what the collector holds afterwards is counted.
+    """
+
+    cov_controller: 'CovController'
+    rows = 10
+
+    def __init__(self, cov_controller, config):
+        self.cov_controller = cov_controller
+        self.tests = []
+        # On xdist workers the list is sent to the master with the other worker output.
+        workeroutput = getattr(config, 'workeroutput', None)
+        if workeroutput is not None:
+            workeroutput['cov_overhead'] = self.tests
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_call(self, item):
+        collector = self.cov_controller.cov._collector
+        if not self.cov_controller.started or collector is None:
+            yield
+            return
+        collector.flush_data()
+        start = time.perf_counter()
+        yield
+        duration = time.perf_counter() - start
+        recorded = {filename: len(data) for filename, data in collector.data.items() if data}
+        self.tests.append([item.nodeid, duration, recorded])
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_testnodedown(self, node, error):
+        self.tests.extend(getattr(node, 'workeroutput', {}).get('cov_overhead', []))
+
+    @pytest.hookimpl(trylast=True)
+    def pytest_terminal_summary(self, terminalreporter):
+        if not self.tests or getattr(terminalreporter.config, 'workerinput', None) is not None:
+            return
+        topdir = self.cov_controller.topdir
+
+        def relative(filename):
+            return os.path.relpath(filename, topdir) if filename.startswith(topdir + os.sep) else filename
+
+        files = {}
+        for _, _, recorded in self.tests:
+            for filename, count in recorded.items():
+                total, tests = files.get(filename, (0, 0))
+                files[filename] = total + count, tests + 1
+
+        tests = sorted(self.tests, key=lambda test: (-sum(test[2].values()), -test[1]))[: self.rows]
+        width = max(len('Test'), *(len(nodeid) for nodeid, _, _ in tests))
+        terminalreporter.write_sep('-', f'coverage overhead: top {len(tests)} tests by recorded lines')
+        terminalreporter.write(f'{"Test":<{width}}   Recorded   Files     Time\n')
+        for nodeid, duration, recorded in tests:
+            terminalreporter.write(f'{nodeid:<{width}}  {sum(recorded.values()):>9} {len(recorded):>7} {duration:>7.3f}s\n')
+
+        top_files = sorted(files.items(), key=lambda item: (-item[1][0], item[0]))[: self.rows]
+        width = max(len('File'), *(len(relative(filename)) for filename, _ in top_files))
+        terminalreporter.write_sep('-', f'coverage overhead: top {len(top_files)} source files by recorded lines')
+        terminalreporter.write(f'{"File":<{width}}   Recorded   Tests\n')
+        for filename, (total, count) in top_files:
+            terminalreporter.write(f'{relative(filename):<{width}}  {total:>9} {count:>7}\n')
+
+
 @pytest.fixture
 def no_cover():
     """A pytest fixture to disable coverage."""
@@ -467,5 +879,16 @@ def cov(request):
     return None
 
 
+@pytest.fixture
+def cov_snapshot(cov):
+    """A pytest fixture to read the coverage measured so far, without stopping coverage."""
+    if cov is None:
+        return None
+
+    from . import snapshot
+
+    return functools.partial(snapshot.take, cov)
+
+
 def pytest_configure(config):
     config.addinivalue_line('markers', 'no_cover: disable coverage for this test.')
@@ -0,0 +1,24 @@
+"""Third-party report types, registered with entry points.
+
+A package adds a report type by declaring an entry point in the ``pytest_cov.reporters`` group, for example::
+
+    [project.entry-points."pytest_cov.reporters"]
+    sonarqube = "mypackage.coverage:sonarqube_report"
+
+The entry point is a callable taking ``(cov, analyses, output)``: the ``coverage.Coverage`` object with the combined
+data, a list of ``(file_reporter, analysis)`` pairs for the files to report on, computed once and shared by all the
+third-party reporters, and the destination. It returns the total percentage or None.
+"""
+
+import functools
+from importlib.metadata import entry_points
+
+GROUP = 'pytest_cov.reporters'
+
+
+@functools.cache
+def custom_reporters():
+    """Return the entry points of the registered report types, by name."""
+    found = entry_points()
+    found = found.select(group=GROUP) if hasattr(found, 'select') else found.get(GROUP, [])
+    return {entry_point.name: entry_point for entry_point in found}
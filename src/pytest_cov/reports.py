@@ -0,0 +1,208 @@
+"""Streaming report writers that output each file as soon as it is analysed."""
+
+import collections
+import datetime
+import gzip
+import json
+import os
+import tempfile
+import time
+import xml.dom.minidom
+from io import StringIO
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+from coverage import __version__
+from coverage.jsonreport import FORMAT_VERSION
+from coverage.jsonreport import JsonReporter
+from coverage.lcovreport import LcovReporter
+from coverage.misc import human_sorted
+from coverage.misc import human_sorted_items
+from coverage.report_core import get_analysis_to_report
+from coverage.version import __url__
+from coverage.xmlreport import DTD_URL
+from coverage.xmlreport import XmlReporter
+from coverage.xmlreport import rate
+
+
+def _attrs(**attrs):
+    """Format XML attributes the way minidom does, with "lines_valid" written as "lines-valid"."""
+    return ''.join(f' {name.replace("_", "-")}="{escape(str(value), {chr(34): "&quot;"})}"' for name, value in attrs.items())
+
+
+class StreamingXmlReporter(XmlReporter):
+    """Cobertura XML reporter that does not keep the whole document in memory.
+
+    Each class element is serialized to a spool file as soon as its source file is analysed. The root and package
+    elements carry totals so they are written at the end, copying the spooled class elements in place.
+    """
+
+    def report(self, morfs, outfile=None):
+        has_arcs = self.coverage.get_data().has_arcs()
+        impl = xml.dom.minidom.getDOMImplementation()
+        self.xml_out = impl.createDocument(None, 'coverage', None)
+
+        spooled = collections.defaultdict(list)
+        with tempfile.TemporaryFile('w+', encoding='utf-8') as spool:
+            for fr, analysis in get_analysis_to_report(self.coverage, morfs):
+                self.xml_file(fr, analysis, has_arcs)
+                for package_name, package in self.packages.items():
+                    for rel_name, xclass in package.elements.items():
+                        chunk = StringIO()
+                        xclass.writexml(chunk, '\t\t\t\t', '\t', '\n')
+                        spooled[package_name].append((rel_name, (spool.tell(), len(chunk.getvalue()))))
+                        spool.write(chunk.getvalue())
+                    package.elements.clear()
+
+            lnum_tot = sum(package.lines for package in self.packages.values())
+            lhits_tot = sum(package.hits for package in self.packages.values())
+            bnum_tot = sum(package.branches for package in self.packages.values())
+            bhits_tot = sum(package.br_hits for package in self.packages.values())
+            if has_arcs:
+                branch_attrs = {'branches_valid': bnum_tot, 'branches_covered': bhits_tot, 'branch_rate': rate(bhits_tot, bnum_tot)}
+            else:
+                branch_attrs = {'branches_covered': 0, 'branches_valid': 0, 'branch_rate': 0}
+
+            outfile.write('<?xml version="1.0" ?>\n')
+            outfile.write(
+                '<coverage{}>\n'.format(
+                    _attrs(
+                        version=__version__,
+                        timestamp=int(time.time() * 1000),
+                        lines_valid=lnum_tot,
+                        lines_covered=lhits_tot,
+                        line_rate=rate(lhits_tot, lnum_tot),
+                        **branch_attrs,
+                        complexity=0,
+                    )
+                )
+            )
+            outfile.write(f'\t<!-- Generated by coverage.py: {__url__} -->\n')
+            outfile.write(f'\t<!-- Based on {DTD_URL} -->\n')
+            if self.source_paths:
+                outfile.write('\t<sources>\n')
+                for path in human_sorted(self.source_paths):
+                    outfile.write(f'\t\t<source>{escape(path)}</source>\n')
+                outfile.write('\t</sources>\n')
+            else:
+                outfile.write('\t<sources/>\n')
+
+            if self.packages:
+                outfile.write('\t<packages>\n')
+                for package_name, package in human_sorted_items(self.packages.items()):
+                    package_attrs = _attrs(
+                        name=package_name.replace(os.sep, '.'),
+                        line_rate=rate(package.hits, package.lines),
+                        branch_rate=rate(package.br_hits, package.branches) if has_arcs else 0,
+                        complexity=0,
+                    )
+                    outfile.write(f'\t\t<package{package_attrs}>\n')
+                    outfile.write('\t\t\t<classes>\n')
+                    for _, (offset, length) in human_sorted_items(spooled[package_name]):
+                        spool.seek(offset)
+                        outfile.write(spool.read(length))
+                    outfile.write('\t\t\t</classes>\n')
+                    outfile.write('\t\t</package>\n')
+                outfile.write('\t</packages>\n')
+            else:
+                outfile.write('\t<packages/>\n')
+            outfile.write('</coverage>\n')
+
+        denom = lnum_tot + bnum_tot
+        return 100.0 * (lhits_tot + bhits_tot) / denom if denom else 0.0
+
+
+class StreamingJsonReporter(JsonReporter):
+    """JSON reporter that writes the entry of each file as soon as it is analysed.
+
+    The totals come last in the document so nothing but the running total is kept in memory.
+    """
+
+    def report(self, morfs, outfile):
+        coverage_data = self.coverage.get_data()
+        coverage_data.set_query_contexts(self.config.report_contexts)
+        indent = 4 if self.config.json_pretty_print else None
+        newline = '\n' if indent else ''
+
+        def dump(value, level):
+            text = json.dumps(value, indent=indent)
+            return text.replace('\n', '\n' + ' ' * indent * level) if indent else text
+
+        outfile.write('{' + newline)
+        self._write_member(outfile, 'meta', dump(self._meta(coverage_data), 1), indent)
+        outfile.write(',' + (newline or ' '))
+        self._write_member(outfile, 'files', '{', indent)
+        separator = newline
+        for file_reporter, analysis in get_analysis_to_report(self.coverage, morfs):
+            reported_file = self.report_one_file(coverage_data, analysis, file_reporter)
+            outfile.write(separator)
+            self._write_member(outfile, file_reporter.relative_filename(), dump(reported_file, 2), indent and indent * 2)
+            separator = ',' + (newline or ' ')
+        if separator != newline:
+            outfile.write(newline + ' ' * (indent or 0))
+        outfile.write('},' + (newline or ' '))
+        self._write_member(outfile, 'totals', dump(self._totals(coverage_data), 1), indent)
+        outfile.write(newline + '}')
+
+        return self.total.n_statements and self.total.pc_covered
+
+    @staticmethod
+    def _write_member(outfile, name, value, indent):
+        outfile.write(f'{" " * (indent or 0)}{json.dumps(name)}: {value}')
+
+    def _meta(self, coverage_data):
+        return {
+            'format': FORMAT_VERSION,
+            'version': __version__,
+            'timestamp': datetime.datetime.now().isoformat(),  # noqa: DTZ005
+            'branch_coverage': coverage_data.has_arcs(),
+            'show_contexts': self.config.json_show_contexts,
+        }
+
+    def _totals(self, coverage_data):
+        totals = self.make_summary(self.total)
+        if coverage_data.has_arcs():
+            totals.update(self.make_branch_summary(self.total))
+        return totals
+
+
+class NdjsonReporter(StreamingJsonReporter):
+    """Newline delimited JSON reporter: a meta line, one line per file and a final totals line."""
+
+    def report(self, morfs, outfile):
+        coverage_data = self.coverage.get_data()
+        coverage_data.set_query_contexts(self.config.report_contexts)
+        outfile.write(json.dumps({'meta': self._meta(coverage_data)}) + '\n')
+        for file_reporter, analysis in get_analysis_to_report(self.coverage, morfs):
+            reported_file = self.report_one_file(coverage_data, analysis, file_reporter)
+            outfile.write(json.dumps({'filename': file_reporter.relative_filename(), **reported_file}) + '\n')
+        outfile.write(json.dumps({'totals': self._totals(coverage_data)}) + '\n')
+
+        return self.total.n_statements and self.total.pc_covered
+
+
+class StreamingLcovReporter(LcovReporter):
+    """LCOV reporter that writes each record as soon as its file is analysed, instead of sorting them all first."""
+
+    def report(self, morfs, outfile):
+        self.coverage.get_data()
+        for fr, analysis in get_analysis_to_report(self.coverage, morfs):
+            self.total += analysis.numbers
+            self.lcov_file(fr.relative_filename(), fr, analysis, outfile)
+
+        return self.total.n_statements and self.total.pc_covered
+
+
+def render_report(cov, reporter_cls, output):
+    """Write a report with one of the reporters above, compressing it if the output ends with ".gz"."""
+    cov.config.ignore_errors = True
+    cov._prepare_data_for_reporting()
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    opener = gzip.open if output.suffix == '.gz' else open
+    try:
+        with opener(output, 'wt', encoding='utf-8') as outfile:
+            return reporter_cls(cov).report(None, outfile)
+    except BaseException:
+        output.unlink(missing_ok=True)
+        raise
@@ -0,0 +1,75 @@
+"""Read the coverage measured so far without stopping the measurement.
+
+Coverage keeps what the tracer records in memory and only writes it to the data file when it's saved or when the dynamic
+context switches. Stopping coverage to look at the data tears down the tracer and writes everything to disk, which is slow
+and changes the data of the session. A snapshot copies the data the tracer recorded since it last wrote to the data file
+into an in-memory database instead, and reads the data file (if anything was written to it already) only for the files it
+is asked about.
+"""
+
+import copy
+
+from coverage.data import CoverageData
+from coverage.files import abs_file
+
+
+class Snapshot:
+    """The coverage measured when the snapshot was taken.
+
+    Paths can be relative to the current directory.
+    """
+
+    def __init__(self, saved, recent):
+        self._data = [data for data in (saved, recent) if data is not None]
+
+    def measured_files(self):
+        """Return the set of the absolute paths of the files measured so far."""
+        return set().union(*(data.measured_files() for data in self._data))
+
+    def has_arcs(self):
+        """Return True if the snapshot has branch coverage (arcs) instead of lines."""
+        return any(data.has_arcs() for data in self._data)
+
+    def lines(self, path):
+        """Return the sorted lines executed in `path`, or None if `path` was not measured."""
+        return self._collect(path, 'lines')
+
+    def arcs(self, path):
+        """Return the sorted arcs executed in `path`, or None if `path` was not measured or without branch coverage."""
+        if not self.has_arcs():
+            return None
+        return self._collect(path, 'arcs')
+
+    def was_executed(self, path, line):
+        """Return True if `line` of `path` was executed."""
+        return line in (self.lines(path) or ())
+
+    def _collect(self, path, kind):
+        path = abs_file(path)
+        found = None
+        for data in self._data:
+            values = getattr(data, kind)(path)
+            if values is not None:
+                found = (found or set()).union(values)
+        return None if found is None else sorted(found)
+
+
+def take(cov):
+    """Return a :class:`Snapshot` of the data measured by `cov` so far, without stopping it or writing to disk."""
+    saved = getattr(cov, '_data', None)
+    if saved is not None and not saved._have_used:
+        # Nothing was written to the data file yet, and reading it would create it.
+        saved = None
+
+    recent = None
+    collector = getattr(cov, '_collector', None)
+    if collector is not None:
+        recent = CoverageData(no_disk=True)
+        recent.set_context(collector.covdata._current_context)
+        # A shallow copy of the collector shares the tracers and their data: flushing it copies the data into the
+        # in-memory database, and not clearing the data afterwards leaves the tracers untouched.
+        clone = copy.copy(collector)
+        clone.covdata = recent
+        clone._clear_data = lambda: None
+        clone.flush_data()
+    return Snapshot(saved, recent)
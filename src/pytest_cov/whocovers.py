@@ -0,0 +1,202 @@
+"""Find the tests that executed some lines, from data measured with ``--cov-context=test``.
+
+Usage::
+
+    pytest-cov-who-covers src/mypackage/module.py:120
+    pytest-cov-who-covers src/mypackage/module.py:120-135
+
+Reading the contexts of a line from the coverage data file takes a while with many tests, so the first query builds a
+reverse index next to the data file (``.coverage-who-covers`` by default), and the next queries only read the postings
+of the lines they ask for. The index is built again when the data file changes.
+
+The index is a sqlite database with a table of the measured files, a table of the contexts, and one row per (file, line)
+with the ids of the contexts that executed the line: sorted, delta encoded as varints and compressed with zlib.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import zlib
+from pathlib import Path
+
+from coverage.data import CoverageData
+from coverage.exceptions import CoverageException
+from coverage.numbits import numbits_to_nums
+
+INDEX_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE file (id INTEGER PRIMARY KEY, path TEXT UNIQUE);
+CREATE TABLE context (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE posting (file_id INTEGER, line INTEGER, contexts BLOB, PRIMARY KEY (file_id, line)) WITHOUT ROWID;
+"""
+
+
+def encode_postings(ids):
+    """Return the compressed posting list of a sorted list of ids."""
+    out = bytearray()
+    previous = 0
+    for value in ids:
+        delta = value - previous
+        previous = value
+        while delta >= 0x80:
+            out.append(delta & 0x7F | 0x80)
+            delta >>= 7
+        out.append(delta)
+    return zlib.compress(bytes(out))
+
+
+def decode_postings(blob):
+    """Return the sorted list of ids of a compressed posting list."""
+    ids = []
+    value = shift = previous = 0
+    for byte in zlib.decompress(blob):
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            previous += value
+            ids.append(previous)
+            value = shift = 0
+    return ids
+
+
+def _stamp(data_file):
+    stat = Path(data_file).stat()
+    return f'{INDEX_VERSION}:{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def build_index(data_file, index_file):
+    """Build the reverse index of a coverage data file, in a single pass over its tables."""
+    data = CoverageData(data_file)
+    data.read()
+    lines = {}
+    with data._connect() as con:
+        with con.execute('SELECT id, path FROM file') as cur:
+            files = dict(cur)
+        with con.execute('SELECT id, context FROM context') as cur:
+            contexts = dict(cur)
+        if data.has_arcs():
+            with con.execute('SELECT file_id, context_id, fromno, tono FROM arc') as cur:
+                for file_id, context_id, fromno, tono in cur:
+                    for line in (fromno, tono):
+                        if line > 0:
+                            lines.setdefault((file_id, line), set()).add(context_id)
+        else:
+            with con.execute('SELECT file_id, context_id, numbits FROM line_bits') as cur:
+                for file_id, context_id, numbits in cur:
+                    for line in numbits_to_nums(numbits):
+                        lines.setdefault((file_id, line), set()).add(context_id)
+
+    target = Path(f'{index_file}.tmp')
+    target.unlink(missing_ok=True)
+    with sqlite3.connect(target) as index:
+        index.executescript(SCHEMA)
+        index.execute('INSERT INTO meta (key, value) VALUES (?, ?)', ('stamp', _stamp(data_file)))
+        index.executemany('INSERT INTO file (id, path) VALUES (?, ?)', files.items())
+        index.executemany('INSERT INTO context (id, name) VALUES (?, ?)', ((key, name) for key, name in contexts.items() if name))
+        index.executemany(
+            'INSERT INTO posting (file_id, line, contexts) VALUES (?, ?, ?)',
+            ((file_id, line, encode_postings(sorted(ids))) for (file_id, line), ids in sorted(lines.items())),
+        )
+    index.close()
+    target.replace(index_file)
+
+
+def _open_index(data_file, index_file):
+    if Path(index_file).exists():
+        index = sqlite3.connect(index_file)
+        try:
+            (stamp,) = index.execute("SELECT value FROM meta WHERE key = 'stamp'").fetchone()
+        except sqlite3.DatabaseError:
+            stamp = None
+        if stamp == _stamp(data_file):
+            return index
+        index.close()
+    build_index(data_file, index_file)
+    return sqlite3.connect(index_file)
+
+
+def _find_file(index, filename):
+    path = os.path.abspath(filename)  # noqa: PTH100
+    row = index.execute('SELECT id, path FROM file WHERE path = ?', (path,)).fetchone()
+    if row is not None:
+        return row
+    suffix = os.sep + os.path.normpath(filename).lstrip(os.sep)
+    rows = index.execute("SELECT id, path FROM file WHERE path LIKE '%' || ?", (suffix,)).fetchall()
+    rows = [row for row in rows if row[1].endswith(suffix)]
+    if len(rows) > 1:
+        raise CoverageException(f'{filename} matches several measured files: {", ".join(sorted(path for _, path in rows))}')
+    if not rows:
+        raise CoverageException(f'{filename} was not measured.')
+    return rows[0]
+
+
+def who_covers(data_file, filename, first, last=None, index_file=None):
+    """Return the sorted contexts that executed the lines `first` to `last` of `filename`."""
+    if index_file is None:
+        index_file = f'{data_file}-who-covers'
+    index = _open_index(data_file, index_file)
+    try:
+        file_id, _ = _find_file(index, filename)
+        ids = set()
+        for (blob,) in index.execute(
+            'SELECT contexts FROM posting WHERE file_id = ? AND line BETWEEN ? AND ?', (file_id, first, first if last is None else last)
+        ):
+            ids.update(decode_postings(blob))
+        ids = sorted(ids)
+        found = set()
+        for start in range(0, len(ids), 500):
+            chunk = ids[start : start + 500]
+            found.update(name for (name,) in index.execute(f'SELECT name FROM context WHERE id IN ({",".join("?" * len(chunk))})', chunk))  # noqa: S608
+        return sorted(found)
+    finally:
+        index.close()
+
+
+def _location(value):
+    filename, sep, lines = value.rpartition(':')
+    first, _, last = lines.partition('-')
+    try:
+        first = int(first)
+        last = int(last) if last else first
+    except ValueError:
+        first = None
+    if not sep or not filename or first is None or first > last:
+        raise argparse.ArgumentTypeError(f'{value!r} is not FILE:LINE or FILE:FIRST-LAST')
+    return filename, first, last
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='pytest-cov-who-covers',
+        description='Show the tests that executed some lines, from coverage data measured with --cov-context=test.',
+    )
+    parser.add_argument('location', type=_location, metavar='FILE:LINE[-LINE]', help='The lines to look up.')
+    parser.add_argument(
+        '--data-file',
+        default=os.environ.get('COVERAGE_FILE', '.coverage'),
+        help='The coverage data file. Default: $COVERAGE_FILE or .coverage',
+    )
+    parser.add_argument('--contexts', action='store_true', help='Show the contexts (with the test phase) instead of the tests.')
+    args = parser.parse_args(argv)
+
+    if not Path(args.data_file).exists():
+        parser.error(f'No coverage data file: {args.data_file}')
+    filename, first, last = args.location
+    try:
+        contexts = who_covers(args.data_file, filename, first, last)
+    except CoverageException as exc:
+        print(f'pytest-cov-who-covers: {exc}', file=sys.stderr)
+        return 1
+    if not args.contexts:
+        contexts = sorted({context.rpartition('|')[0] or context for context in contexts})
+    for context in contexts:
+        print(context)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
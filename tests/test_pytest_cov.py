@@ -1,9 +1,13 @@
 import collections
 import glob
+import gzip
+import json
 import os
 import platform
 import re
+import subprocess
 import sys
+import time
 from itertools import chain
 from pathlib import Path
 from types import SimpleNamespace
@@ -338,6 +342,24 @@ def test_xml_output_dir(testdir):
     assert result.ret == 0
 
 
+def test_xml_output_after_chdir(testdir):
+    script = testdir.makepyfile(
+        """
+import os
+
+def test_chdir():
+    os.mkdir('sub')
+    os.chdir('sub')
+"""
+    )
+
+    result = testdir.runpytest('-v', f'--cov={script.dirpath()}', '--cov-report=xml', script)
+
+    assert result.ret == 0
+    assert testdir.tmpdir.join('coverage.xml').check()
+    assert not testdir.tmpdir.join('sub', 'coverage.xml').check()
+
+
 def test_json_output_dir(testdir):
     script = testdir.makepyfile(SCRIPT)
 
@@ -440,6 +462,1063 @@ def test_lcov_output_dir(testdir):
     assert result.ret == 0
 
 
+def test_reuse_reports(testdir):
+    script = testdir.makepyfile(SCRIPT)
+    args = ('-v', f'--cov={script.dirpath()}', '--cov-reuse-reports', '--cov-report=term', '--cov-report=html', '--cov-report=xml', script)
+
+    result = testdir.runpytest(*args)
+    result.stdout.fnmatch_lines(['Coverage HTML written to dir htmlcov', 'Coverage XML written to file coverage.xml'])
+    assert result.ret == 0
+    index = testdir.tmpdir.join('htmlcov', 'index.html')
+    index.setmtime(0)
+
+    result = testdir.runpytest(*args)
+    result.stdout.fnmatch_lines(
+        [
+            'test_reuse_reports* 9 * 89%*',
+            'Coverage HTML up to date in dir htmlcov',
+            'Coverage XML up to date in file coverage.xml',
+        ]
+    )
+    assert index.mtime() == 0
+    assert result.ret == 0
+
+    script.write(SCRIPT + '\nx = 1\n')
+    result = testdir.runpytest(*args)
+    result.stdout.fnmatch_lines(['Coverage HTML written to dir htmlcov', 'Coverage XML written to file coverage.xml'])
+    assert index.mtime() != 0
+    assert result.ret == 0
+
+
+def test_report_background(testdir):
+    script = testdir.makepyfile(SCRIPT)
+
+    args = (
+        '-v',
+        f'--cov={script.dirpath()}',
+        '--cov-report-background',
+        '--cov-report=term',
+        '--cov-report=html:' + DEST_DIR,
+        '--cov-report=xml:' + XML_REPORT_NAME,
+        '--cov-fail-under=50',
+        script,
+    )
+    testdir.runpytest(*args)
+    result = testdir.runpytest(*args)
+
+    result.stdout.fnmatch_lines(
+        [
+            '*_ coverage: platform *, python * _*',
+            'test_report_background* 9 * 89%*',
+            'Required test coverage of 50% reached. Total coverage: 88.89%',
+            '*10 passed*',
+            'Coverage HTML written to dir ' + DEST_DIR,
+            'Coverage XML written to file ' + XML_REPORT_NAME,
+        ]
+    )
+    assert testdir.tmpdir.join(DEST_DIR, 'index.html').check()
+    assert testdir.tmpdir.join(XML_REPORT_NAME).check()
+    assert not testdir.tmpdir.listdir('*.tmp*')
+    assert result.ret == 0
+
+
+def test_stream_reports(testdir):
+    script = testdir.makepyfile(SCRIPT)
+
+    result = testdir.runpytest(
+        '-v',
+        f'--cov={script.dirpath()}',
+        '--cov-stream-reports',
+        '--cov-report=xml:' + XML_REPORT_NAME,
+        '--cov-report=json:cov.json.gz',
+        '--cov-report=lcov:' + LCOV_REPORT_NAME,
+        '--cov-report=ndjson',
+        script,
+    )
+
+    result.stdout.fnmatch_lines(
+        [
+            'Coverage XML written to file ' + XML_REPORT_NAME,
+            'Coverage JSON written to file cov.json.gz',
+            'Coverage NDJSON written to file coverage.ndjson',
+            'Coverage LCOV written to file ' + LCOV_REPORT_NAME,
+        ]
+    )
+    assert result.ret == 0
+
+    cov = coverage.Coverage()
+    cov.load()
+    cov.xml_report(outfile='expected.xml')
+    cov.json_report(outfile='expected.json')
+    cov.lcov_report(outfile='expected.info')
+
+    def without_timestamp(text):
+        return re.sub(r'timestamp(="\d+"|": "[^"]+")', '', text)
+
+    assert without_timestamp(testdir.tmpdir.join(XML_REPORT_NAME).read()) == without_timestamp(testdir.tmpdir.join('expected.xml').read())
+    with gzip.open(str(testdir.tmpdir.join('cov.json.gz')), 'rt') as fh:
+        assert without_timestamp(fh.read()) == without_timestamp(testdir.tmpdir.join('expected.json').read())
+    assert testdir.tmpdir.join(LCOV_REPORT_NAME).read() == testdir.tmpdir.join('expected.info').read()
+
+    lines = [json.loads(line) for line in testdir.tmpdir.join('coverage.ndjson').readlines()]
+    expected = json.loads(testdir.tmpdir.join('expected.json').read())
+    assert [line['filename'] for line in lines[1:-1]] == list(expected['files'])
+    assert lines[-1] == {'totals': expected['totals']}
+
+
+def test_binary_report(testdir):
+    script = testdir.makepyfile(SCRIPT)
+
+    result = testdir.runpytest('-v', f'--cov={script.dirpath()}', '--cov-branch', '--cov-context=test', '--cov-report=binary', script)
+
+    result.stdout.fnmatch_lines(['Coverage binary snapshot written to file coverage.bin'])
+    assert result.ret == 0
+
+    cov = coverage.Coverage()
+    cov.load()
+    cov.json_report(outfile='expected.json')
+    expected = json.loads(testdir.tmpdir.join('expected.json').read())
+
+    from pytest_cov.binary import BinaryReport
+
+    with BinaryReport(str(testdir.tmpdir.join('coverage.bin'))) as report:
+        assert report.has_branches
+        assert report.has_contexts
+        assert report.files() == sorted(expected['files'])
+        assert report.percent_covered == expected['totals']['percent_covered']
+        assert report.totals() == {
+            'statements': expected['totals']['num_statements'],
+            'missing': expected['totals']['missing_lines'],
+            'excluded': expected['totals']['excluded_lines'],
+            'branches': expected['totals']['num_branches'],
+            'partial_branches': expected['totals']['num_partial_branches'],
+            'missing_branches': expected['totals']['missing_branches'],
+        }
+        for filename, info in expected['files'].items():
+            assert report.totals(filename)['statements'] == info['summary']['num_statements']
+            partial = {start for start, _ in info['missing_branches']}
+            for line in info['executed_lines']:
+                assert report.line_status(filename, line) == ('partial' if line in partial else 'executed')
+                assert report.line_contexts(filename, line)
+            for line in info['missing_lines']:
+                assert report.line_status(filename, line) == 'missing'
+                assert report.line_contexts(filename, line) == []
+        assert report.line_status(script.basename, 6) is None
+        assert 'test_binary_report.py::test_foo[0]|run' in report.line_contexts(script.basename, 8)
+        with pytest.raises(KeyError):
+            report.line_status('missing.py', 1)
+
+
+def test_binary_report_backslash_paths(testdir, monkeypatch):
+    from coverage.python import PythonFileReporter
+
+    from pytest_cov.binary import BinaryReport
+    from pytest_cov.binary import write_binary_report
+
+    # "a\z.py" sorts after "a0.py" but "a/z.py" sorts before it.
+    testdir.makepyfile(a0='VALUE = 0\n')
+    testdir.mkpydir('a').join('z.py').write('VALUE = 1\n')
+    data = coverage.CoverageData(str(testdir.tmpdir.join('.coverage')))
+    data.add_lines({str(testdir.tmpdir.join('a0.py')): [1], str(testdir.tmpdir.join('a', 'z.py')): [1]})
+    data.write()
+    relative_filename = PythonFileReporter.relative_filename
+    monkeypatch.setattr(PythonFileReporter, 'relative_filename', lambda self: relative_filename(self).replace('/', '\\'))
+    cov = coverage.Coverage(data_file=str(testdir.tmpdir.join('.coverage')))
+    cov.load()
+
+    write_binary_report(cov, str(testdir.tmpdir.join('coverage.bin')))
+
+    with BinaryReport(str(testdir.tmpdir.join('coverage.bin'))) as report:
+        assert report.line_status('a0.py', 1) == 'executed'
+        assert report.line_status('a/z.py', 1) == 'executed'
+        assert report.line_status('a\\z.py', 1) == 'executed'
+
+
+@pytest.fixture
+def git(testdir):
+    """Run git in the test directory."""
+
+    def run(*args):
+        subprocess.check_call(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com', *args], cwd=str(testdir.tmpdir))  # noqa: S603, S607
+
+    return run
+
+
+def test_diff_report(testdir, git):
+    testdir.makepyfile(
+        mod='def covered():\n    return 1\n', test_mod='import mod\n\ndef test_mod():\n    mod.covered()\n    mod.new_covered()\n'
+    )
+    git('init', '-q')
+    git('add', '.')
+    git('commit', '-q', '-m', 'base')
+    git('branch', 'base')
+    testdir.makepyfile(mod='def covered():\n    return 1\n\ndef new_covered():\n    return 2\n\ndef new_missing():\n    return 3\n')
+    git('commit', '-q', '-am', 'change')
+
+    result = testdir.runpytest('-v', '--cov', '--cov-report=diff:base', '--cov-diff-fail-under=80')
+
+    result.stdout.fnmatch_lines(
+        [
+            '*_ diff coverage: against base _*',
+            'Changed lines since base (merge base *)',
+            'Name * Stmts * Miss * Cover * Missing',
+            'mod.py * 5 * 1 * 80% * 8',
+            'TOTAL * 5 * 1 * 80%',
+        ]
+    )
+    result.stdout.no_fnmatch_line('test_mod.py *%*')
+    assert result.ret == 0
+
+    result = testdir.runpytest('-v', '--cov', '--cov-report=diff:base', '--cov-diff-fail-under=90')
+
+    result.stdout.fnmatch_lines(['*ERROR: Coverage failure: changed lines total of 80 is less than diff-fail-under=90*'])
+    assert result.ret != 0
+
+    result = testdir.runpytest('-v', '--cov', '--cov-report=diff:HEAD', '--cov-diff-fail-under=100')
+
+    result.stdout.fnmatch_lines(['No changed statements.'])
+    assert result.ret == 0
+
+    result = testdir.runpytest(
+        '-v', '--cov=.', '--cov-report=diff:missing', '--cov-report=xml', '--cov-fail-under=50', '--cov-diff-fail-under=100'
+    )
+
+    assert 'Could not produce the diff report against missing: git merge-base failed' in result.stdout.str() + result.stderr.str()
+    result.stdout.fnmatch_lines(['Coverage XML written to file coverage.xml', 'Required test coverage of 50% reached. Total coverage: *'])
+    assert testdir.tmpdir.join('coverage.xml').check()
+    assert result.ret == 0
+
+
+def test_compare(testdir):
+    testdir.makepyfile(
+        mod='def one():\n    return 1\n\ndef two():\n    return 2\n',
+        other='def three():\n    return 3\n',
+        test_mod='import mod, other\n\ndef test_mod():\n    mod.one()\n',
+    )
+
+    result = testdir.runpytest('-v', '--cov=.', '--cov-report=', '--cov-compare=cache')
+
+    result.stdout.fnmatch_lines(['*_ coverage change: against cache _*', 'No previous coverage summary in the cache.'])
+    assert result.ret == 0
+    testdir.tmpdir.join('.coverage').copy(testdir.tmpdir.join('previous.coverage'))
+
+    testdir.makepyfile(test_mod='import mod, other\n\ndef test_mod():\n    mod.one()\n    mod.two()\n')
+    result = testdir.runpytest('-v', '--cov=.', '--cov-report=', '--cov-compare=cache')
+
+    result.stdout.fnmatch_lines(
+        [
+            'Name * Before * After * Change',
+            'mod.py * 75% * 100% * +25%',
+            'TOTAL * 78% * 90% * +12%',
+        ]
+    )
+    result.stdout.no_fnmatch_line('other.py *')
+    result.stdout.no_fnmatch_line('test_mod.py *')
+
+    result = testdir.runpytest('-v', '--cov=.', '--cov-report=', '--cov-compare=previous.coverage')
+
+    result.stdout.fnmatch_lines(
+        [
+            '*_ coverage change: against previous.coverage _*',
+            'mod.py * 75% * 100% * +25%',
+            'test_mod.py * 75% * 100% * +25%',
+            'TOTAL * 70% * 90% * +20%',
+        ]
+    )
+
+    result = testdir.runpytest('-v', '--cov=.', '--cov-report=', '--cov-compare=missing.coverage')
+
+    result.stdout.fnmatch_lines(['No previous coverage data in missing.coverage.'])
+
+
+@pytest.mark.parametrize(
+    'name',
+    [
+        'my mod.py',
+        pytest.param('say "hi".py', marks=pytest.mark.skipif('sys.platform == "win32"')),
+        pytest.param('tab\there.py', marks=pytest.mark.skipif('sys.platform == "win32"')),
+    ],
+)
+def test_diff_changed_lines_unusual_names(testdir, git, name):
+    from pytest_cov.diff import changed_lines
+
+    path = testdir.tmpdir.join(name)
+    path.write('A = 1\n')
+    git('init', '-q')
+    git('add', '.')
+    git('commit', '-q', '-m', 'base')
+    path.write('A = 1\nB = 2\n')
+
+    _, changed = changed_lines('HEAD', str(testdir.tmpdir))
+
+    assert changed == {str(Path(str(path)).resolve()): {2}}
+
+
+def test_diff_and_compare_share_the_analysis(testdir, git):
+    testdir.makepyfile(
+        mod='def one():\n    return 1\n\ndef two():\n    return 2\n',
+        test_mod='import mod\n\ndef test_mod():\n    mod.one()\n',
+        conftest="""
+from coverage import report_core
+
+from pytest_cov import compare, diff, engine
+
+passes = []
+
+def counting(*args):
+    passes.append(args)
+    return report_core.get_analysis_to_report(*args)
+
+for module in (compare, diff, engine):
+    if hasattr(module, 'get_analysis_to_report'):
+        module.get_analysis_to_report = counting
+
+def pytest_unconfigure(config):
+    with open('passes.txt', 'w') as fh:
+        fh.write(str(len(passes)))
+""",
+    )
+
+    git('init', '-q')
+    git('add', '.')
+    git('commit', '-q', '-m', 'base')
+    testdir.makepyfile(mod='def one():\n    return 1\n\ndef two():\n    return 3\n')
+
+    result = testdir.runpytest('-v', '--cov=.', '--cov-report=diff:HEAD', '--cov-compare=cache')
+
+    result.stdout.fnmatch_lines(
+        [
+            '*_ diff coverage: against HEAD _*',
+            'mod.py * 1 * 1 * 0% * 5',
+            '*_ coverage change: against cache _*',
+            'No previous coverage summary in the cache.',
+        ]
+    )
+    assert testdir.tmpdir.join('passes.txt').read() == '1'
+
+
+HOOKS_CONFTEST = """
+import os
+
+def record(*args):
+    with open(os.path.join(os.path.dirname(__file__), 'hooks.log'), 'a') as fh:
+        fh.write(' '.join(map(str, args)) + '\\n')
+
+def pytest_cov_started(controller):
+    record('started', type(controller).__name__, os.getpid())
+
+def pytest_cov_worker_data_received(node, size):
+    record('worker_data_received', node.gateway.id, size)
+
+def pytest_cov_before_combine(cov):
+    record('before_combine', type(cov).__name__)
+
+def pytest_cov_after_combine(data):
+    record('after_combine', sorted(os.path.basename(path) for path in data.measured_files()))
+
+def pytest_cov_report_done(kind, duration):
+    record('report_done', kind, duration >= 0)
+"""
+
+
+@pytest.mark.parametrize('opts', ['', '-n 2'], ids=['nodist', '2xdist'])
+def test_hooks(testdir, opts):
+    script = testdir.makepyfile(SCRIPT)
+    testdir.makeconftest(HOOKS_CONFTEST)
+
+    result = testdir.runpytest('-v', f'--cov={script.dirpath()}', '--cov-report=term-missing', '--cov-report=xml', script, *opts.split())
+
+    assert result.ret == 0
+    log = testdir.tmpdir.join('hooks.log').read().splitlines()
+    expected = [
+        'before_combine Coverage',
+        "after_combine ['conftest.py', 'test_hooks.py']",
+        'report_done term-missing True',
+        'report_done xml True',
+    ]
+    started = [line.split() for line in log if line.startswith('started')]
+    # One event in each process.
+    assert len({pid for _, _, pid in started}) == len(started)
+    log = log[len(started) :]
+    if opts:
+        assert sorted(name for _, name, _ in started) == ['DistMaster', 'DistWorker', 'DistWorker']
+        assert sorted(log[:2]) == ['worker_data_received gw0 None', 'worker_data_received gw1 None']
+        assert log[2:] == expected
+    else:
+        assert [name for _, name, _ in started] == ['Central']
+        assert log == expected
+
+
+CUSTOM_REPORTER = """
+import json
+
+def report(cov, analyses, output):
+    with open(output, 'w') as fh:
+        json.dump({fr.relative_filename(): sorted(analysis.missing) for fr, analysis in analyses}, fh)
+    return 42.0
+"""
+
+
+def test_custom_reporter(testdir):
+    script = testdir.makepyfile(SCRIPT)
+    testdir.makepyfile(fakereporter=CUSTOM_REPORTER)
+    dist_info = testdir.mkdir('fakereporter-1.0.dist-info')
+    dist_info.join('METADATA').write('Metadata-Version: 2.1\nName: fakereporter\nVersion: 1.0\n')
+    dist_info.join('entry_points.txt').write('[pytest_cov.reporters]\nmissing = fakereporter:report\n')
+
+    result = testdir.runpytest(
+        '-v', f'--cov={script.dirpath()}', '--cov-report=missing', '--cov-report=missing', '--cov-fail-under=42', script
+    )
+
+    result.stdout.fnmatch_lines(['Coverage missing report written to file coverage.missing', '*Required test coverage of 42% reached*'])
+    assert result.ret == 0
+    assert json.loads(testdir.tmpdir.join('coverage.missing').read())[script.basename] == [11]
+
+    result = testdir.runpytest('-v', f'--cov={script.dirpath()}', '--cov-report=missing:out/missing.json', '--cov-report=xml', script)
+
+    result.stdout.fnmatch_lines(['Coverage XML written to file coverage.xml', 'Coverage missing report written to file out/missing.json'])
+    assert testdir.tmpdir.join('out', 'missing.json').check()
+
+    result = testdir.runpytest('-v', f'--cov={script.dirpath()}', '--cov-report=unknown', script)
+
+    result.stderr.fnmatch_lines(['*invalid choice: "unknown"*'])
+    assert result.ret == 4
+
+
+OVERHEAD_SCRIPT = """
+import helper
+
+def test_small():
+    assert True
+
+def test_big():
+    helper.do_lots()
+"""
+
+OVERHEAD_HELPER = """
+def do_lots():
+    a = 1
+    b = 2
+    c = 3
+    d = 4
+    return a + b + c + d
+"""
+
+
+@pytest.mark.parametrize('opts', ['', '-n 2'], ids=['nodist', '2xdist'])
+def test_overhead_report(testdir, opts):
+    script = testdir.makepyfile(OVERHEAD_SCRIPT)
+    testdir.makepyfile(helper=OVERHEAD_HELPER)
+
+    result = testdir.runpytest('-v', f'--cov={script.dirpath()}', '--cov-overhead-report', script, *opts.split())
+
+    result.stdout.fnmatch_lines(
+        [
+            'TOTAL * 11 * 0 * 100%',
+            '*- coverage overhead: top 2 tests by recorded lines -*',
+            'Test * Recorded * Files * Time',
+            'test_overhead_report.py::test_big * 6 * 2 * *s',
+            'test_overhead_report.py::test_small * 1 * 1 * *s',
+            '*- coverage overhead: top 2 source files by recorded lines -*',
+            'File * Recorded * Tests',
+            'helper.py * 5 * 1',
+            'test_overhead_report.py * 2 * 2',
+        ]
+    )
+    assert result.ret == 0
+
+
+def test_import_cache(testdir):
+    testdir.makepyfile(
+        mod='import sys\n\nif sys.version_info < (3,):\n    NEVER = True\n\ndef used():\n    return 1\n',
+        test_mod='import mod\n\ndef test_used():\n    assert mod.used() == 1\n',
+    )
+    args = ('-v', '--cov=.', '--cov-report=term-missing', '--cov-import-cache')
+
+    result = testdir.runpytest(*args)
+
+    result.stdout.fnmatch_lines(['mod.py * 5 * 1 * 80% * 4'])
+    cache = testdir.tmpdir.join('.coverage-imports.json')
+    snapshot = json.loads(cache.read())
+    mod = next(filename for filename in snapshot['lines'] if Path(filename).name == 'mod.py')
+    assert snapshot['lines'][mod] == [1, 3, 6]
+
+    # Collection is not traced when the snapshot is current, the import time lines come from it.
+    snapshot['lines'][mod].append(4)
+    cache.write(json.dumps(snapshot))
+    result = testdir.runpytest(*args)
+
+    result.stdout.fnmatch_lines(['mod.py * 5 * 0 * 100%'])
+
+    testdir.makepyfile(mod='import sys\n\nif sys.version_info < (3,):\n    NEVER = True\n\ndef used():\n    return 2\n')
+    testdir.makepyfile(test_mod='import mod\n\ndef test_used():\n    assert mod.used() == 2\n')
+    result = testdir.runpytest(*args)
+
+    result.stdout.fnmatch_lines(['mod.py * 5 * 1 * 80% * 4'])
+    assert json.loads(cache.read())['lines'][mod] == [1, 3, 6]
+
+    testdir.makepyfile(other='VALUE = 1\n', test_other='import other\n\ndef test_other():\n    assert other.VALUE\n')
+    result = testdir.runpytest(*args)
+
+    result.stdout.fnmatch_lines(['*CovImportCacheWarning: 2 modules imported during collection are not in the import cache*'])
+    assert not cache.check()
+
+
+@pytest.mark.parametrize('opts', ['', '-n 2'], ids=['nodist', '2xdist'])
+def test_source_inventory(testdir, opts):
+    pkg = testdir.mkpydir('pkg')
+    pkg.join('used.py').write('def used():\n    return 1\n')
+    pkg.join('unused.py').write('def unused():\n    return 1\n')
+    pkg.mkdir('scripts').join('script.py').write('print(1)\n')
+    testdir.makepyfile(test_pkg='from pkg.used import used\n\ndef test_used():\n    assert used() == 1\n')
+    # Directories changed just before being listed are not cached.
+    for path in (pkg, pkg.join('scripts')):
+        os.utime(path, (time.time() - 60, time.time() - 60))
+    args = ('-v', '--cov=pkg', '--cov-report=term-missing', '--cov-source-inventory', *opts.split())
+
+    result = testdir.runpytest(*args)
+
+    result.stdout.fnmatch_lines(['pkg?unused.py * 2 * 2 * 0% * 1-2', 'TOTAL * 4 * 2 * 50%'])
+    result.stdout.no_fnmatch_line('*script.py*')
+    cache = testdir.tmpdir.join('.coverage-sources.json')
+    inventory = json.loads(cache.read())
+    entry = inventory['dirs'][str(pkg)]
+    assert sorted(entry['files']) == ['__init__.py', 'unused.py', 'used.py']
+    assert entry['dirs'] == ['scripts']
+
+    # The directories that didn't change are not listed again.
+    entry['files'].remove('unused.py')
+    cache.write(json.dumps(inventory))
+    result = testdir.runpytest(*args)
+
+    result.stdout.fnmatch_lines(['TOTAL * 2 * 0 * 100%'])
+    result.stdout.no_fnmatch_line('*unused.py*')
+
+    pkg.join('new.py').write('NEW = 1\n')
+    result = testdir.runpytest(*args)
+
+    result.stdout.fnmatch_lines(['pkg?new.py * 1 * 1 * 0% * 1', 'pkg?unused.py * 2 * 2 * 0% * 1-2', 'TOTAL * 5 * 3 * 40%'])
+
+
+def test_order_new_lines_first(testdir, git):
+    testdir.makepyfile(
+        mod='def a():\n    return 1\n\ndef b():\n    return 2\n',
+        test_mod='import mod\n\ndef test_a():\n    assert mod.a() == 1\n\ndef test_nothing():\n    pass\n\ndef test_b():\n    assert mod.b()\n',
+    )
+    git('init', '-q')
+    git('add', '.')
+    git('commit', '-q', '-m', 'base')
+    args = ('-v', '-p', 'no:randomly', '--cov=.', '--cov-context=test', '--cov-order=new-lines-first')
+
+    result = testdir.runpytest(*args)
+
+    result.stdout.fnmatch_lines(['*::test_a PASSED*', '*::test_nothing PASSED*', '*::test_b PASSED*'])
+    assert result.ret == 0
+
+    # Running a subset of the tests keeps what the others executed in the index.
+    result = testdir.runpytest(*args, '-k', 'test_a')
+    assert result.ret == 0
+    result = testdir.runpytest(*args)
+
+    result.stdout.no_fnmatch_line('*moved first*')
+    result.stdout.fnmatch_lines(['*::test_a PASSED*', '*::test_nothing PASSED*', '*::test_b PASSED*'])
+
+    testdir.makepyfile(mod='def a():\n    return 1\n\ndef b():\n    return 3\n')
+    testdir.makepyfile(test_new='def test_new():\n    pass\n')
+    result = testdir.runpytest(*args)
+
+    result.stdout.fnmatch_lines(
+        [
+            'coverage: 3 tests affected by the changes moved first',
+            '*::test_new PASSED*',
+            '*::test_b PASSED*',
+            '*::test_a PASSED*',
+            '*::test_nothing PASSED*',
+        ]
+    )
+    assert result.ret == 0
+
+
+def test_affinity(testdir):
+    testdir.makepyfile(
+        mod_a='def a(x):\n    y = x + 1\n    return y\n',
+        mod_b='def b(x):\n    y = x - 1\n    return y\n',
+        test_mods="""
+import mod_a
+import mod_b
+
+def test_a1():
+    assert mod_a.a(1) == 2
+
+def test_b1():
+    assert mod_b.b(1) == 0
+
+def test_a2():
+    assert mod_a.a(2) == 3
+
+def test_b2():
+    assert mod_b.b(2) == 1
+""",
+    )
+    args = ('-v', '-p', 'no:randomly', '--cov=.', '--cov-context=test', '--cov-affinity', '-n', '2', max_worker_restart_0)
+
+    result = testdir.runpytest(*args)
+    assert result.ret == 0
+
+    result = testdir.runpytest(*args)
+
+    workers = {}
+    for line in result.stdout.lines:
+        match = re.match(r'\[(gw\d)\] .*PASSED test_mods.py::(test_\w+)@cov:(mod_\w).py', line)
+        if match:
+            workers[match.group(2)] = match.group(1), match.group(3)
+    assert len(workers) == 4
+    assert workers['test_a1'] == workers['test_a2']
+    assert workers['test_a1'][1] == 'mod_a'
+    assert workers['test_b1'] == workers['test_b2']
+    assert workers['test_b1'][1] == 'mod_b'
+    assert result.ret == 0
+
+
+def test_rerun(testdir):
+    testdir.makepyfile(
+        mod='def a():\n    return 1\n\ndef b():\n    return 2\n',
+        test_mod='import mod\n\ndef test_a():\n    assert mod.a() == 1\n\ndef test_b():\n    assert mod.b() == 3\n',
+    )
+    args = ('-p', 'no:randomly', '--cov=.', '--cov-report=term-missing', '--cov-rerun')
+
+    result = testdir.runpytest(*args)
+    result.stdout.fnmatch_lines(['mod.py * 4 * 0 * 100%'])
+    assert result.ret == 1
+
+    testdir.makepyfile(test_mod='import mod\n\ndef test_a():\n    assert mod.a() == 1\n\ndef test_b():\n    pass\n')
+    result = testdir.runpytest('--lf', *args)
+
+    result.stdout.fnmatch_lines(['run-last-failure: rerun previous 1 failure', 'mod.py * 4 * 1 * 75% * 5', '*1 passed*'])
+    assert result.ret == 0
+
+
+def test_who_covers(testdir, capsys):
+    from pytest_cov import whocovers
+
+    testdir.makepyfile(
+        mod='def a():\n    return 1\n\ndef b():\n    return 2\n',
+        test_mod='import mod\n\ndef test_a():\n    assert mod.a() == 1\n\ndef test_b():\n    assert mod.b() == 2\n\ndef test_ab():\n    assert mod.a() + mod.b() == 3\n',
+    )
+    result = testdir.runpytest('-p', 'no:randomly', '--cov=.', '--cov-context=test')
+    assert result.ret == 0
+    capsys.readouterr()
+    data_file = str(testdir.tmpdir.join('.coverage'))
+    mod = str(testdir.tmpdir.join('mod.py'))
+
+    assert whocovers.main(['--data-file', data_file, f'{mod}:2']) == 0
+    assert capsys.readouterr().out == 'test_mod.py::test_a\ntest_mod.py::test_ab\n'
+    assert testdir.tmpdir.join('.coverage-who-covers').check()
+
+    assert whocovers.main(['--data-file', data_file, '--contexts', 'mod.py:2-5']) == 0
+    assert capsys.readouterr().out == 'test_mod.py::test_ab|run\ntest_mod.py::test_a|run\ntest_mod.py::test_b|run\n'
+
+    assert whocovers.main(['--data-file', data_file, 'other.py:1']) == 1
+    assert 'other.py was not measured.' in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('opts', ['', '-n 2'], ids=['nodist', '2xdist'])
+def test_append_merged(testdir, opts):
+    testdir.makepyfile(
+        mod='def a():\n    return 1\n\ndef b():\n    return 2\n',
+        test_a='import mod\n\ndef test_a():\n    assert mod.a() == 1\n',
+        test_b='import mod\n\ndef test_b():\n    assert mod.b() == 2\n',
+    )
+    args = ('-v', '--cov=.', '--cov-report=term-missing', '--cov-context=test', '--cov-append-merged', *opts.split())
+
+    result = testdir.runpytest(*args, 'test_a.py')
+
+    result.stdout.fnmatch_lines(['mod.py * 4 * 1 * 75% * 5'])
+    result = testdir.runpytest(*args, 'test_b.py')
+
+    result.stdout.fnmatch_lines(['mod.py * 4 * 0 * 100%'])
+    data = coverage.CoverageData(str(testdir.tmpdir.join('.coverage')))
+    data.read()
+    assert data.measured_contexts() == {''}
+    assert sorted(data.lines(str(testdir.tmpdir.join('mod.py')))) == [1, 2, 4, 5]
+
+
+def test_compact(testdir, capsys):
+    from pytest_cov import compact
+
+    testdir.makepyfile(
+        mod='def a():\n    return 1\n\ndef b():\n    return 2\n',
+        test_mod='import mod\n\ndef test_a():\n    assert mod.a() == 1\n\ndef test_b():\n    assert mod.b() == 2\n',
+    )
+    result = testdir.runpytest('--cov=.', '--cov-context=test', '--cov-branch')
+    assert result.ret == 0
+    capsys.readouterr()
+    data_file = str(testdir.tmpdir.join('.coverage'))
+    mod = str(testdir.tmpdir.join('mod.py'))
+    data = coverage.CoverageData(data_file)
+    data.read()
+    arcs = sorted(data.arcs(mod))
+    assert len(data.measured_contexts()) == 3
+
+    assert compact.main([data_file, '--keep-contexts']) == 0
+    capsys.readouterr()
+    data = coverage.CoverageData(data_file)
+    data.read()
+    assert len(data.measured_contexts()) == 3
+
+    assert compact.main([data_file]) == 0
+    assert capsys.readouterr().out.startswith(f'{data_file}: ')
+    data = coverage.CoverageData(data_file)
+    data.read()
+    assert data.measured_contexts() == {''}
+    assert sorted(data.arcs(mod)) == arcs
+    assert not glob.glob(f'{data_file}-compact*')  # noqa: PTH207
+
+    assert compact.main([str(testdir.tmpdir.join('missing'))]) == 1
+
+
+@pytest.mark.skipif('not hasattr(__import__("socket"), "AF_UNIX")')
+def test_daemon(testdir):
+    from pytest_cov import daemon
+
+    testdir.makepyfile(
+        mod='def a():\n    return 1\n\ndef b():\n    return 2\n',
+        test_mod='import mod\n\ndef test_a():\n    assert mod.a() == 1\n\ndef test_b():\n    assert mod.b() == 2\n',
+    )
+    socket_path = testdir.tmpdir.join('.coverage-daemon.sock')
+    process = subprocess.Popen([sys.executable, '-m', 'pytest_cov.daemon'], cwd=str(testdir.tmpdir))
+    try:
+        for _ in range(100):
+            if socket_path.check() or process.poll() is not None:
+                break
+            time.sleep(0.1)
+        args = ['test_mod.py', '--cov=.', '--cov-report=term-missing', '--cov-daemon']
+
+        result = testdir.runpytest('-k', 'test_a', *args)
+        result.stdout.fnmatch_lines(['mod.py * 4 * 1 * 75% * 5', '*1 passed*'])
+
+        # The data of the previous run is merged, and the total checked is the one of the daemon even with file reports.
+        result = testdir.runpytest('-k', 'test_b', *args, '--cov-report=xml', '--cov-fail-under=100')
+        result.stdout.fnmatch_lines(['mod.py * 4 * 0 * 100%', '*Required test coverage of 100% reached*', '*1 passed*'])
+        assert testdir.tmpdir.join('coverage.xml').check()
+
+        # Unless the source changed since.
+        testdir.makepyfile(mod='def a():\n    return 1 + 0\n\ndef b():\n    return 2 + 0\n')
+        result = testdir.runpytest('-k', 'test_a', *args)
+        result.stdout.fnmatch_lines(['mod.py * 4 * 1 * 75% * 5', '*1 passed*'])
+    finally:
+        assert daemon.main(['--socket', str(socket_path), '--stop']) == 0
+        assert process.wait(10) == 0
+    assert not socket_path.check()
+
+    result = testdir.runpytest('-k', 'test_a', *args)
+    result.stderr.fnmatch_lines(['*Could not get the report from the coverage daemon, making it locally*'])
+    result.stdout.fnmatch_lines(['mod.py * 4 * 1 * 75% * 5', '*1 passed*'])
+
+
+def test_postings_roundtrip():
+    from pytest_cov import whocovers
+
+    ids = [0, 1, 127, 128, 300, 70000, 2**31]
+    assert whocovers.decode_postings(whocovers.encode_postings(ids)) == ids
+
+
+@pytest.mark.parametrize('interrupt', ['raise KeyboardInterrupt', 'os.kill(os.getpid(), signal.SIGTERM)'], ids=['sigint', 'sigterm'])
+def test_partial_report_on_interrupt(testdir, interrupt):
+    testdir.makepyfile(
+        mod='def a():\n    return 1\n\ndef b():\n    return 2\n',
+        test_mod=f"""
+import os
+import signal
+
+import mod
+
+def test_a():
+    assert mod.a() == 1
+
+def test_interrupt():
+    {interrupt}
+
+def test_b():
+    assert mod.b() == 2
+""",
+    )
+
+    result = testdir.runpytest('-p', 'no:randomly', '--cov=.', '--cov-report=term-missing', '--cov-fail-under=100')
+
+    result.stdout.fnmatch_lines(
+        [
+            '*_ coverage: interrupted _*',
+            'The coverage data collected until the interruption was saved in *.coverage.',
+            'TOTAL (partial): *%',
+        ]
+    )
+    result.stdout.no_fnmatch_line('*Required test coverage*')
+    assert testdir.tmpdir.join('.coverage').check()
+    assert result.ret == pytest.ExitCode.INTERRUPTED
+
+
+@pytest.mark.parametrize('opts', ['', '-n 2 -x'], ids=['central', 'xdist'])
+def test_collection_error_is_not_partial(testdir, opts):
+    testdir.makepyfile(
+        mod='def a():\n    return 1\n',
+        test_mod="""
+import mod
+
+def test_a():
+    assert mod.a() == 1
+""",
+        test_bad='import nonexistent\n',
+    )
+
+    result = testdir.runpytest('-p', 'no:randomly', '--cov=.', *opts.split())
+
+    result.stdout.fnmatch_lines(['*Interrupted*'])
+    result.stdout.no_fnmatch_line('*coverage: interrupted*')
+    result.stdout.no_fnmatch_line('TOTAL (partial)*')
+
+
+def test_sigterm_left_alone_in_workers(testdir):
+    script = testdir.makepyfile("""
+import signal
+
+def test_sigterm():
+    assert signal.getsignal(signal.SIGTERM) is signal.SIG_DFL
+""")
+
+    result = testdir.runpytest('-v', '--cov=.', script, '-n', '1')
+
+    result.stdout.fnmatch_lines(['*PASSED*test_sigterm*'])
+    assert result.ret == 0
+
+
+@pytest.mark.skipif('sys.platform == "win32"')
+def test_sigterm_left_alone_in_forked_children(testdir):
+    script = testdir.makepyfile("""
+import multiprocessing
+import signal
+import time
+
+def test_terminate():
+    process = multiprocessing.get_context('fork').Process(target=time.sleep, args=(60,))
+    process.start()
+    time.sleep(0.2)
+    process.terminate()
+    process.join(10)
+    assert process.exitcode == -signal.SIGTERM
+""")
+
+    result = testdir.runpytest('-v', '--cov=.', script)
+
+    result.stdout.fnmatch_lines(['*test_terminate PASSED*'])
+    result.stderr.no_fnmatch_line('*KeyboardInterrupt*')
+    assert result.ret == 0
+
+
+@pytest.mark.skipif('sys.platform == "win32" and platform.python_implementation() == "PyPy"')
+def test_checkpoint_recovers_crashed_worker(testdir):
+    testdir.makepyfile(
+        mod='def a():\n    return 1\n\ndef b():\n    return 2\n',
+        test_mod="""
+import os
+
+import mod
+
+def test_a():
+    assert mod.a() == 1
+
+def test_crash():
+    os._exit(1)
+
+def test_b():
+    assert mod.b() == 2
+""",
+    )
+
+    result = testdir.runpytest('-v', '-p', 'no:randomly', '--cov=.', '--cov-report=term-missing', '--cov-checkpoint=0.001', '-n', '1')
+
+    result.stdout.fnmatch_lines(
+        [
+            '*_ coverage: recovered workers _*',
+            'The following workers crashed, the data of their last checkpoint was combined.',
+            'gw0: * lines in 2 files',
+            'mod.py * 4 * 0 * 100%',
+        ]
+    )
+    result.stdout.no_fnmatch_line('*failed workers*')
+    assert result.ret == 1
+
+
+@pytest.mark.parametrize('opts', ['', '-n 1'], ids=['nodist', '1xdist'])
+def test_flush_every(testdir, opts):
+    testdir.makepyfile(
+        mod='def a():\n    return 1\n\ndef b():\n    return 2\n',
+        test_mod="""
+import mod
+
+def test_a():
+    assert mod.a() == 1
+
+def test_flushed(cov):
+    # The data of test_a was written to the data file, the collector only holds what ran since.
+    assert sorted(cov._data.lines(mod.__file__)) == [1, 2, 4]
+    assert not cov._collector.data.get(mod.__file__)
+""",
+    )
+
+    result = testdir.runpytest('-v', '-p', 'no:randomly', '--cov=.', '--cov-report=term-missing', '--cov-flush-every=1', *opts.split())
+
+    result.stdout.fnmatch_lines(['mod.py * 4 * 1 * 75% * 5', '*2 passed*'])
+    assert result.ret == 0
+
+    result = testdir.runpytest('--cov=.', '--cov-flush-every=0')
+
+    result.stderr.fnmatch_lines(['*argument --cov-flush-every: The value must be greater than 0.'])
+
+
+@pytest.mark.parametrize('report', ['term-missing', 'xml'])
+def test_split_platforms(testdir, report):
+    testdir.makepyfile(
+        mod="""
+import os
+
+def func():
+    if os.environ['PYTEST_XDIST_WORKER'] in ('gw0', 'gw2'):
+        return 1
+    return 2
+""",
+        test_mod="""
+import mod
+
+def test_func():
+    assert mod.func()
+""",
+    )
+    # Make the even and the odd workers look like different platforms.
+    testdir.makeconftest(
+        """
+def pytest_configure_node(node):
+    rinfo = node.gateway._rinfo
+
+    def fake_rinfo(*args, **kwargs):
+        info = rinfo(*args, **kwargs)
+        info.platform = 'fake-even' if node.gateway.id in ('gw0', 'gw2') else 'fake-odd'
+        return info
+
+    node.gateway._rinfo = fake_rinfo
+"""
+    )
+
+    result = testdir.runpytest('-v', '--cov=.', f'--cov-report={report}', '--cov-split-platforms', '--dist=each', '--tx=4*popen')
+
+    assert result.ret == 0
+    if report == 'xml':
+        result.stdout.fnmatch_lines(
+            ['*_ coverage: platform fake-even, python * _*', 'TOTAL: *%', '*_ coverage: platform fake-odd, python * _*', 'TOTAL: *%']
+        )
+    else:
+        result.stdout.fnmatch_lines(
+            [
+                'mod.py * 5 * 0 * 100%',
+                '*_ coverage: platform fake-even, python * _*',
+                'mod.py * 5 * 1 * 80% * 6',
+                '*_ coverage: platform fake-odd, python * _*',
+                'mod.py * 5 * 1 * 80% * 5',
+            ]
+        )
+
+
+@pytest.mark.skipif('sys.platform == "win32" and platform.python_implementation() == "PyPy"')
+def test_split_platforms_subprocesses(testdir, monkeypatch):
+    testdir.makepyprojecttoml(
+        """
+[tool.coverage.run]
+patch = ["subprocess"]
+"""
+    )
+    testdir.makepyfile(
+        mod="""
+import os
+
+def func():
+    if os.environ['PYTEST_XDIST_WORKER'] in ('gw0', 'gw2'):
+        return 1
+    return 2
+
+def sub():
+    return 3
+""",
+        test_mod="""
+import os
+import subprocess
+import sys
+
+import mod
+
+def test_func():
+    assert mod.func()
+    if os.environ['PYTEST_XDIST_WORKER'] in ('gw0', 'gw2'):
+        subprocess.check_call([sys.executable, '-c', 'import mod; mod.sub()'])
+""",
+    )
+    testdir.makeconftest(
+        """
+def pytest_configure_node(node):
+    rinfo = node.gateway._rinfo
+
+    def fake_rinfo(*args, **kwargs):
+        info = rinfo(*args, **kwargs)
+        info.platform = 'fake-even' if node.gateway.id in ('gw0', 'gw2') else 'fake-odd'
+        return info
+
+    node.gateway._rinfo = fake_rinfo
+"""
+    )
+    tmp = testdir.mkdir('tmp')
+    monkeypatch.setenv('TMPDIR', str(tmp))
+
+    result = testdir.runpytest('-v', '--cov=.', '--cov-report=term-missing', '--cov-split-platforms', '--dist=each', '--tx=4*popen')
+
+    assert result.ret == 0
+    result.stdout.fnmatch_lines(
+        [
+            '*_ coverage: platform fake-even, python * _*',
+            'mod.py * 7 * 1 * 86% * 6',
+            '*_ coverage: platform fake-odd, python * _*',
+            'mod.py * 7 * 2 * 71% * 5, 9',
+        ]
+    )
+    assert not tmp.listdir('pytest-cov-split-*')
+
+
+@pytest.mark.parametrize(('workers', 'missing'), [('per-platform', 6), ('gw1', 5)])
+def test_measure_workers(testdir, workers, missing):
+    testdir.makepyfile(
+        mod="""
+import os
+
+def func():
+    if os.environ['PYTEST_XDIST_WORKER'] == 'gw0':
+        return 1
+    return 2
+""",
+        test_mod="""
+import mod
+
+def test_func():
+    assert mod.func()
+""",
+    )
+
+    result = testdir.runpytest(
+        '-v', '--cov=.', '--cov-report=term-missing', f'--cov-measure-workers={workers}', '--dist=each', '--tx=2*popen'
+    )
+
+    assert result.ret == 0
+    result.stdout.fnmatch_lines([f'mod.py * 5 * 1 * 80% * {missing}', '*2 passed*'])
+    result.stdout.no_fnmatch_line('*failed workers*')
+
+
 def test_term_output_dir(testdir):
     script = testdir.makepyfile(SCRIPT)
 
@@ -1115,6 +2194,72 @@ patch = ["subprocess"]
     assert result.ret == 0
 
 
+@pytest.mark.skipif('sys.platform == "win32" and platform.python_implementation() == "PyPy"')
+@pytest.mark.parametrize('opts', ['', '-n 2'], ids=['nodist', '2xdist'])
+def test_coalesce_subprocesses(testdir, opts):
+    testdir.makepyprojecttoml(
+        """
+[tool.coverage.run]
+patch = ["subprocess"]
+"""
+    )
+    scripts = testdir.makepyfile(parent_script=SCRIPT_PARENT, child_script=SCRIPT_CHILD)
+    test_files = testdir.makepyfile(
+        test_files="""
+import glob
+import os
+import subprocess
+import sys
+
+def test_files():
+    assert os.environ['COVERAGE_FILE'].endswith('.subprocesses-%s' % os.getpid())
+    subprocess.check_call([sys.executable, '-c', 'pass'])
+    assert glob.glob('.coverage.subprocesses-%s.*' % os.getpid())
+"""
+    )
+
+    result = testdir.runpytest(
+        '-v',
+        '-p',
+        'no:randomly',
+        f'--cov={scripts.dirpath()}',
+        '--cov-report=term-missing',
+        '--cov-coalesce',
+        *opts.split(),
+        scripts.dirpath().join('parent_script.py'),
+        test_files,
+    )
+
+    result.stdout.fnmatch_lines(
+        [
+            '*_ coverage: platform *, python * _*',
+            f'child_script* {CHILD_SCRIPT_RESULT}*',
+            f'parent_script* {PARENT_SCRIPT_RESULT}*',
+        ]
+    )
+    assert result.ret == 0
+    assert not testdir.tmpdir.listdir('.coverage.*')
+    assert 'COVERAGE_FILE' not in os.environ
+
+
+@pytest.mark.skipif('sys.platform == "win32"')
+def test_coalesce_skips_running_subprocesses(testdir):
+    from pytest_cov.engine import _finished_data_files
+
+    exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+    exited.wait()
+    data_file = testdir.tmpdir.join('.coverage.subprocesses-1')
+    running = testdir.tmpdir.join(f'{data_file.basename}.host.{os.getpid()}.Xabcdefx')
+    finished = [
+        testdir.tmpdir.join(f'{data_file.basename}.host.{exited.pid}.Xabcdefx'),
+        testdir.tmpdir.join(f'{data_file.basename}.my_host.pid{exited.pid}.Xghijklx'),
+    ]
+    for path in [running, *finished]:
+        path.write('')
+
+    assert _finished_data_files(str(data_file)) == sorted(str(path) for path in finished)
+
+
 @pytest.mark.skipif('sys.platform == "win32" and platform.python_implementation() == "PyPy"')
 def test_dist_subprocess_not_collocated(pytester, testdir, tmpdir):
     scripts = testdir.makepyfile(parent_script=SCRIPT_PARENT, child_script=SCRIPT_CHILD)
@@ -1511,6 +2656,44 @@ def test_basic(no_cover):
     result.stdout.fnmatch_lines(['mod* 2 * 1 * 50% * 2'])
 
 
+@pytest.mark.parametrize('opts', [[], ['--cov-branch'], ['--cov-context=test']], ids=['lines', 'branch', 'context'])
+def test_cov_snapshot_fixture(testdir, opts):
+    testdir.makepyfile(
+        mod="""
+def used():
+    return 1
+
+def unused():
+    return 2
+"""
+    )
+    script = testdir.makepyfile(
+        """
+import os
+import mod
+
+def test_before(cov_snapshot):
+    mod.used()
+
+def test_snapshot(cov_snapshot):
+    assert not os.path.exists('.coverage')
+    before = cov_snapshot()
+    assert before.was_executed('mod.py', 2)
+    assert not before.was_executed('mod.py', 5)
+    mod.unused()
+    after = cov_snapshot()
+    assert after.lines('mod.py') == [1, 2, 4, 5]
+    assert not before.was_executed('mod.py', 5)
+    assert os.path.abspath('mod.py') in after.measured_files()
+    assert after.lines('missing.py') is None
+    assert (after.arcs('mod.py') is not None) == after.has_arcs()
+"""
+    )
+    result = testdir.runpytest('-v', '--cov=.', '--cov-report=term-missing', *opts, script)
+    assert result.ret == 0
+    result.stdout.fnmatch_lines(['mod.py * 4 * 0 * 100%', '*2 passed*'])
+
+
 COVERAGERC = """
 [report]
 # Regexes for lines to exclude from consideration